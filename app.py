@@ -1,8 +1,16 @@
-import os, io, sqlite3
+import os, io, re, json, base64, hashlib, shutil, sqlite3, tempfile, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from dateutil.relativedelta import relativedelta
+import numpy as np
 import pandas as pd
-from flask import Flask, render_template, request, redirect, url_for, send_file, jsonify, flash, abort
+import click
+from openpyxl import load_workbook
+from flask import (Flask, Response, render_template, request, redirect, url_for, send_file, jsonify, flash,
+                   abort, g, has_app_context, stream_with_context)
+from flask.cli import AppGroup
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user, UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from reportlab.lib.pagesizes import A4
@@ -21,185 +29,187 @@ os.makedirs(os.path.dirname(APP_DB), exist_ok=True)
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "change-this-in-production")
+app.config["DATABASE"] = APP_DB
 
+# Jumlah koneksi idle yang disimpan per thread (gunicorn gthread memakai ulang thread)
+DB_POOL_SIZE = int(os.getenv("FINANCE_DB_POOL_SIZE", "2"))
 
-# =============================================================================
-# Database helpers
-# =============================================================================
+# Ambang log request lambat (total waktu DB per request / jumlah statement)
+app.config["SLOW_DB_MS"] = float(os.getenv("FINANCE_SLOW_DB_MS", "250"))
+app.config["SLOW_QUERY_COUNT"] = int(os.getenv("FINANCE_SLOW_QUERY_COUNT", "50"))
+# Header X-DB-Stats selalu dikirim saat debug; di produksi bisa dinyalakan manual
+app.config["SQL_STATS_HEADER"] = os.getenv("FINANCE_SQL_STATS_HEADER", "0") == "1"
 
-def db():
-    """Return sqlite3 connection with Row factory & timeout sane defaults."""
-    conn = sqlite3.connect(APP_DB, timeout=5.0)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA busy_timeout = 5000")
-    return conn
+# Cache hasil (konteks dashboard, jumlah riwayat): jumlah entri LRU per proses
+# (0 = mati) dan file SQLite opsional yang dipakai bersama semua worker gunicorn
+app.config["DASHBOARD_CACHE_SIZE"] = int(os.getenv("FINANCE_DASHBOARD_CACHE_SIZE", "256"))
+app.config["SHARED_CACHE_DB"] = os.getenv("FINANCE_SHARED_CACHE_DB") or None
 
-def init_db():
-    """Initialize database schema from schema.sql if DB not exists."""
-    with db() as con, open(os.path.join(os.path.dirname(__file__), "schema.sql"), "r", encoding="utf-8") as f:
-        con.executescript(f.read())
+# Saldo acuan validasi mutasi antar akun: "month" (arus bulan terpilih saja,
+# perilaku lama), "closing" (saldo akhir bulan terpilih, termasuk sisa bulan
+# sebelumnya) atau "alltime" (saldo berjalan semua waktu)
+app.config["TRANSFER_BALANCE_POLICY"] = os.getenv("FINANCE_TRANSFER_BALANCE_POLICY", "closing")
 
-if not os.path.exists(APP_DB):
-    init_db()
+# Job import latar belakang: folder spool file upload dan jumlah thread worker per proses
+app.config["IMPORT_SPOOL_DIR"] = os.getenv("FINANCE_IMPORT_SPOOL_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(APP_DB)), "import_spool")
+app.config["IMPORT_WORKERS"] = int(os.getenv("FINANCE_IMPORT_WORKERS", "2"))
 
-# === Favorites bootstrap (tabel ringan untuk template transaksi) ===
-def ensure_favorites_table():
-    with db() as con:
-        con.execute("""
-            CREATE TABLE IF NOT EXISTS favorites (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                type TEXT NOT NULL CHECK(type IN ('income','expense')),
-                category_id INTEGER NOT NULL,
-                amount REAL,
-                account TEXT,
-                source_or_payee TEXT,
-                notes TEXT,
-                UNIQUE(user_id, name)
-            )
-        """)
 
-# panggil saat startup
-ensure_favorites_table()
+# =============================================================================
+# Database helpers
+# =============================================================================
 
-# === Savings bootstrap (tabel untuk Tab Tabungan) ===
-def ensure_savings_tables():
-    with db() as con:
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS savings_auto_transfers(
-                user_id INTEGER NOT NULL,
-                month TEXT NOT NULL,
-                amount REAL NOT NULL,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY(user_id, month),
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-            """
-        )
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS savings_goals(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                target_amount REAL NOT NULL,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                achieved_at TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-            """
-        )
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS savings_allocations(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                goal_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                date TEXT NOT NULL,
-                note TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (goal_id) REFERENCES savings_goals(id)
-            )
-            """
-        )
+# Cukup dijalankan sekali per koneksi; koneksi dipakai ulang lewat pool.
+SQLITE_PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",       # ~16 MB page cache
+    "PRAGMA mmap_size = 134217728",     # 128 MB
+    "PRAGMA temp_store = MEMORY",
+)
+
+_db_pool = threading.local()
+
+class QueryStats:
+    """Statement count, total DB time and slowest statement of one request."""
+    __slots__ = ("count", "total", "slowest", "slowest_sql")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = ""
+
+    def record(self, sql: str, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.slowest:
+            # hanya teks SQL dengan placeholder; parameter tidak pernah disimpan
+            self.slowest, self.slowest_sql = elapsed, sql
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that times execute()/executemany() while `stats` is set.
+
+    Biayanya dua perf_counter() per statement, jadi aman dibiarkan aktif di
+    produksi. Waktu yang dicatat adalah eksekusi statement (tanpa fetch lanjutan).
+    """
+    stats = None
 
-        # Pastikan kolom archived_at ada pada savings_goals (untuk arsip)
+    def execute(self, sql, params=()):
+        stats = self.stats
+        if stats is None:
+            return super().execute(sql, params)
+        t0 = time.perf_counter()
         try:
-            cols = con.execute("PRAGMA table_info(savings_goals)").fetchall()
-            col_names = {c[1] for c in cols}
-            if "archived_at" not in col_names:
-                con.execute("ALTER TABLE savings_goals ADD COLUMN archived_at TEXT")
-        except Exception:
-            pass
+            return super().execute(sql, params)
+        finally:
+            stats.record(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, seq_of_params):
+        stats = self.stats
+        if stats is None:
+            return super().executemany(sql, seq_of_params)
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            stats.record(sql, time.perf_counter() - t0)
 
-        # Tabel top-up manual
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS savings_manual_topups(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                month TEXT NOT NULL,
-                date TEXT NOT NULL,
-                amount REAL NOT NULL,
-                note TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-            """
-        )
+def connect():
+    """Open a new, fully configured connection (bypasses the pool)."""
+    conn = sqlite3.connect(app.config["DATABASE"], timeout=5.0, factory=InstrumentedConnection)
+    conn.row_factory = sqlite3.Row
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    # list penampung SQL (dengan parameter) untuk `flask db check-plans`
+    trace = app.config.get("SQL_TRACE")
+    if trace is not None:
+        conn.set_trace_callback(trace.append)
+    return conn
 
-        # Tambahkan kolom transaction_id jika belum ada (link ke tabel transactions)
-        try:
-            cols = con.execute("PRAGMA table_info(savings_manual_topups)").fetchall()
-            col_names = {c[1] for c in cols}
-            if "transaction_id" not in col_names:
-                con.execute("ALTER TABLE savings_manual_topups ADD COLUMN transaction_id INTEGER")
-        except Exception:
-            pass
+def _idle_connections() -> list:
+    """Pool koneksi idle milik thread ini, dipisah per path DB."""
+    pools = getattr(_db_pool, "idle", None)
+    if pools is None:
+        pools = _db_pool.idle = {}
+    return pools.setdefault(app.config["DATABASE"], [])
+
+def _acquire_connection():
+    idle = _idle_connections()
+    return idle.pop() if idle else connect()
+
+def _release_connection(conn):
+    # jangan kembalikan koneksi dengan transaksi menggantung ke pool
+    if conn.in_transaction:
+        conn.rollback()
+    idle = _idle_connections()
+    if len(idle) < DB_POOL_SIZE:
+        idle.append(conn)
+    else:
+        conn.close()
 
-        # Tabel konsumsi tabungan permanen
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS savings_consumed(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                note TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-            """
-        )
+def db():
+    """Return the sqlite3 connection bound to the current app/request context.
 
-ensure_savings_tables()
+    Within a request every caller (routes, helpers, load_user) shares one
+    pooled connection; it goes back to the per-thread pool on teardown.
+    Outside an app context (startup scripts) a fresh connection is returned.
+    """
+    if not has_app_context():
+        return connect()
+    conn = g.get("_db")
+    if conn is None:
+        conn = g._db = _acquire_connection()
+        conn.stats = g.db_stats = QueryStats()
+        g.db_changes = conn.total_changes
+    return conn
 
-# === Account transfers (mutasi antar akun) ===
-def ensure_account_transfers_table():
-    with db() as con:
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS account_transfers(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                date TEXT NOT NULL,
-                from_account TEXT NOT NULL CHECK(from_account IN ('Transfer','Tunai','E-Wallet')),
-                to_account   TEXT NOT NULL CHECK(to_account   IN ('Transfer','Tunai','E-Wallet')),
-                amount REAL NOT NULL,
-                note TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-            """
+@app.before_request
+def _fresh_db_stats():
+    # Request test client di dalam app context CLI (mis. `flask db check-plans`)
+    # memakai g yang sama: mulai statistik baru supaya angkanya per request.
+    conn = g.get("_db")
+    if conn is not None:
+        conn.stats = g.db_stats = QueryStats()
+        g.db_changes = conn.total_changes
+
+@app.after_request
+def _report_db_stats(response):
+    stats = g.get("db_stats")
+    if stats is None:
+        return response
+    total_ms, slowest_ms = stats.total * 1000, stats.slowest * 1000
+    if total_ms > app.config["SLOW_DB_MS"] or stats.count > app.config["SLOW_QUERY_COUNT"]:
+        app.logger.warning(
+            "Request lambat %s %s: %d query, DB %.1f ms, terlama %.1f ms: %s",
+            request.method, request.path, stats.count, total_ms, slowest_ms,
+            " ".join(stats.slowest_sql.split())[:300],
+        )
+    if app.debug or app.config["SQL_STATS_HEADER"]:
+        response.headers["X-DB-Stats"] = (
+            f"queries={stats.count}; db_ms={total_ms:.2f}; slowest_ms={slowest_ms:.2f}"
         )
+    return response
 
-        # Migration: add fee_transaction_id if missing (link to transactions)
-        try:
-            cols = con.execute("PRAGMA table_info(account_transfers)").fetchall()
-            col_names = {c[1] for c in cols}
-            if "fee_transaction_id" not in col_names:
-                con.execute("ALTER TABLE account_transfers ADD COLUMN fee_transaction_id INTEGER")
-        except Exception:
-            pass
+@app.teardown_appcontext
+def _teardown_db(exc):
+    conn = g.pop("_db", None)
+    if conn is not None:
+        conn.stats = None
+        _release_connection(conn)
 
-ensure_account_transfers_table()
 
-# Pastikan kolom emoji pada categories ada (untuk ikon kategori)
-def ensure_categories_emoji_column():
-    with db() as con:
-        try:
-            cols = con.execute("PRAGMA table_info(categories)").fetchall()
-            col_names = {c[1] for c in cols}
-            if "emoji" not in col_names:
-                con.execute("ALTER TABLE categories ADD COLUMN emoji TEXT")
-        except Exception:
-            pass
+# =============================================================================
+# Schema migrations
+# =============================================================================
+# Versi skema disimpan di PRAGMA user_version. Tiap migrasi bernomor hanya
+# dijalankan sekali, di bawah lock EXCLUSIVE, lewat `flask db upgrade`.
 
-ensure_categories_emoji_column()
+SCHEMA_SQL = os.path.join(os.path.dirname(__file__), "schema.sql")
 
-# Isi emoji default untuk kategori bawaan jika belum ada
+# Emoji default untuk kategori bawaan
 DEFAULT_EMOJI = {
     ("income", "Gaji"): "💼",
     ("income", "Bonus"): "🎁",
@@ -214,15 +224,440 @@ DEFAULT_EMOJI = {
     ("expense", "Lainnya"): "✨",
 }
 
-def backfill_default_category_emojis():
-    with db() as con:
-        for (t, name), emo in DEFAULT_EMOJI.items():
-            con.execute(
-                "UPDATE categories SET emoji=? WHERE type=? AND name=? AND (emoji IS NULL OR emoji='')",
-                (emo, t, name)
-            )
+def _sql_statements(script: str):
+    """Split a SQL script into single statements (executescript would COMMIT)."""
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            yield buf.strip()
+            buf = ""
+
+def _add_column(con, table: str, column: str, decl: str):
+    cols = {c[1] for c in con.execute(f"PRAGMA table_info({table})").fetchall()}
+    if column not in cols:
+        con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _m001_baseline(con):
+    """schema.sql + tabel/kolom yang dulu dibuat oleh ensure_* saat startup."""
+    with open(SCHEMA_SQL, "r", encoding="utf-8") as f:
+        for stmt in _sql_statements(f.read()):
+            con.execute(stmt)
+
+    # Favorites (template transaksi)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS favorites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL CHECK(type IN ('income','expense')),
+            category_id INTEGER NOT NULL,
+            amount REAL,
+            account TEXT,
+            source_or_payee TEXT,
+            notes TEXT,
+            UNIQUE(user_id, name)
+        )
+    """)
+
+    # Tabungan: arsip goal & link top-up manual ke transaksi
+    _add_column(con, "savings_goals", "archived_at", "TEXT")
+    _add_column(con, "savings_manual_topups", "transaction_id", "INTEGER")
+
+    # Mutasi antar akun + link ke transaksi biaya admin
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS account_transfers(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            from_account TEXT NOT NULL CHECK(from_account IN ('Transfer','Tunai','E-Wallet')),
+            to_account   TEXT NOT NULL CHECK(to_account   IN ('Transfer','Tunai','E-Wallet')),
+            amount REAL NOT NULL,
+            note TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    _add_column(con, "account_transfers", "fee_transaction_id", "INTEGER")
+
+    # Ikon kategori
+    _add_column(con, "categories", "emoji", "TEXT")
 
-backfill_default_category_emojis()
+def _m002_default_emojis(con):
+    for (t, name), emo in DEFAULT_EMOJI.items():
+        con.execute(
+            "UPDATE categories SET emoji=? WHERE type=? AND name=? AND (emoji IS NULL OR emoji='')",
+            (emo, t, name)
+        )
+
+def _m003_month_range_indexes(con):
+    con.execute("CREATE INDEX IF NOT EXISTS idx_transfers_user_date ON account_transfers(user_id, date)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trx_user_type_date ON transactions(user_id, type, date)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trx_user_account_date ON transactions(user_id, account, date)")
+    # (user_id, type) sudah tercakup prefix idx_trx_user_type_date
+    con.execute("DROP INDEX IF EXISTS idx_trx_user_type")
+
+def _m004_monthly_rollups(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS monthly_rollups(
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,                 -- YYYY-MM
+            type TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            account TEXT NOT NULL DEFAULT '',
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, type, category_id, account)
+        ) WITHOUT ROWID
+    """)
+    rebuild_rollups(con)
+
+def _m005_account_balances(con):
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS account_balances(
+            user_id INTEGER NOT NULL,
+            account TEXT NOT NULL,
+            balance REAL NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, account)
+        ) WITHOUT ROWID
+    """)
+    verify_account_balances(con, fix=True)
+
+# Kolom uang yang dipindah dari REAL ke INTEGER (rupiah bulat)
+MONEY_COLUMNS = {
+    "transactions": ("amount",),
+    "budgets": ("amount",),
+    "account_transfers": ("amount",),
+    "favorites": ("amount",),
+    "savings_auto_transfers": ("amount",),
+    "savings_goals": ("target_amount",),
+    "savings_allocations": ("amount",),
+    "savings_manual_topups": ("amount",),
+    "savings_consumed": ("amount",),
+    "monthly_rollups": ("total",),
+    "account_balances": ("balance",),
+}
+
+def _rebuild_money_table(con, table: str, columns: tuple):
+    """Salin ulang tabel dengan kolom uang ber-affinity INTEGER (SQLite tidak
+    bisa ALTER tipe kolom). DDL lama dipakai ulang, index dibuat kembali."""
+    ddl = con.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)
+    ).fetchone()[0]
+    for col in columns:
+        ddl = re.sub(rf"\b({col}\s+)REAL\b", r"\1INTEGER", ddl)
+    ddl = re.sub(rf"^CREATE TABLE\s+(IF NOT EXISTS\s+)?[\"']?{table}[\"']?",
+                 f"CREATE TABLE {table}__new", ddl)
+    indexes = [r[0] for r in con.execute(
+        "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (table,)
+    )]
+    names = [c[1] for c in con.execute(f"PRAGMA table_info({table})")]
+    select = ", ".join(f"CAST(ROUND({n}) AS INTEGER)" if n in columns else n for n in names)
+    con.execute(ddl)
+    con.execute(f"INSERT INTO {table}__new({', '.join(names)}) SELECT {select} FROM {table}")
+    con.execute(f"DROP TABLE {table}")
+    con.execute(f"ALTER TABLE {table}__new RENAME TO {table}")
+    for ix in indexes:
+        con.execute(ix)
+
+def _m006_integer_money(con):
+    for table, columns in MONEY_COLUMNS.items():
+        _rebuild_money_table(con, table, columns)
+    # total turunan dihitung ulang dari nominal yang sudah dibulatkan
+    rebuild_rollups(con)
+    verify_account_balances(con, fix=True)
+
+def _m007_data_version(con):
+    # dinaikkan setiap kali data user berubah; dipakai sebagai kunci cache
+    _add_column(con, "users", "data_version", "INTEGER NOT NULL DEFAULT 0")
+
+def _m008_transactions_fts(con):
+    # Index full-text payee/catatan/kategori; rowid = transactions.id.
+    # Disinkronkan trigger, jadi semua jalur tulis (termasuk bulk) ikut.
+    con.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+            payee, notes, category, user_id UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3',
+            detail = column      -- cukup untuk query per kata; index ~25% lebih kecil
+        )
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trx_fts_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO transactions_fts(rowid, payee, notes, category, user_id)
+            VALUES (new.id, new.source_or_payee, new.notes,
+                    (SELECT name FROM categories WHERE id=new.category_id), new.user_id);
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trx_fts_delete AFTER DELETE ON transactions BEGIN
+            DELETE FROM transactions_fts WHERE rowid=old.id;
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS trx_fts_update
+        AFTER UPDATE OF source_or_payee, notes, category_id ON transactions BEGIN
+            UPDATE transactions_fts
+               SET payee=new.source_or_payee, notes=new.notes,
+                   category=(SELECT name FROM categories WHERE id=new.category_id)
+             WHERE rowid=new.id;
+        END
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS category_fts_rename AFTER UPDATE OF name ON categories
+        WHEN new.name IS NOT old.name BEGIN
+            UPDATE transactions_fts SET category=new.name
+             WHERE rowid IN (SELECT id FROM transactions WHERE user_id=new.user_id AND category_id=new.id);
+        END
+    """)
+    rebuild_search_index(con)
+
+def _m009_history_sort_indexes(con):
+    # Kunci sort riwayat tanpa NULL: akun kosong = '', nama kategori disalin ke
+    # cat_sort (ORDER BY c.name lewat JOIN tidak bisa memakai index).
+    _add_column(con, "transactions", "cat_sort", "TEXT NOT NULL DEFAULT ''")
+    con.execute("UPDATE transactions SET account='' WHERE account IS NULL")
+    con.execute("""
+        UPDATE transactions
+           SET cat_sort = COALESCE((SELECT name FROM categories c WHERE c.id=transactions.category_id), '')
+    """)
+    con.execute("""
+        CREATE TRIGGER IF NOT EXISTS category_sort_rename AFTER UPDATE OF name ON categories
+        WHEN new.name IS NOT old.name BEGIN
+            UPDATE transactions SET cat_sort=new.name WHERE user_id=new.user_id AND category_id=new.id;
+        END
+    """)
+    # Satu index per urutan HISTORY_SORTS (rowid ikut di ujung setiap index).
+    # Urutan campuran (kunci ASC, terbaru dulu) butuh index "_recent" sendiri;
+    # kebalikan penuhnya dilayani index yang sama dibaca mundur. Index cat_sort
+    # juga melayani filter kategori (history_page memasang cat_sort=?).
+    for ddl in (
+        "idx_trx_user_amount ON transactions(user_id, amount)",
+        "idx_trx_user_cat_amount ON transactions(user_id, cat_sort, amount)",
+        "idx_trx_user_cat_date ON transactions(user_id, cat_sort, date)",
+        "idx_trx_user_cat_recent ON transactions(user_id, cat_sort, date DESC, id DESC)",
+        "idx_trx_user_account_recent ON transactions(user_id, account, date DESC, id DESC)",
+        "idx_trx_user_type_recent ON transactions(user_id, type, date DESC, id DESC)",
+    ):
+        con.execute("CREATE INDEX IF NOT EXISTS " + ddl)
+
+def _m010_autosave_watermark(con):
+    # autosave_through = bulan terakhir yang sudah final di savings_auto_transfers;
+    # bulan <= watermark yang berubah sesudahnya dicatat di savings_dirty_months.
+    # NULL -> semua bulan dihitung ulang pada kunjungan /savings berikutnya.
+    _add_column(con, "users", "autosave_through", "TEXT")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS savings_dirty_months(
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            PRIMARY KEY (user_id, month)
+        ) WITHOUT ROWID
+    """)
+
+def _m011_goal_achieved_backfill(con):
+    # achieved_at dulu ditandai saat /savings dibuka; kini saat alokasi berubah.
+    # Goal yang sudah tercapai tapi belum sempat ditandai diisi sekarang.
+    con.execute("""
+        UPDATE savings_goals SET achieved_at=CURRENT_TIMESTAMP
+        WHERE achieved_at IS NULL
+          AND target_amount <= (SELECT COALESCE(SUM(a.amount),0) FROM savings_allocations a
+                                WHERE a.user_id=savings_goals.user_id AND a.goal_id=savings_goals.id)
+    """)
+
+def _m012_savings_ledger(con):
+    # Ringkasan tabungan yang dipelihara write path (lihat _savings_adjust)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS savings_ledger(
+            user_id INTEGER PRIMARY KEY,
+            total_in INTEGER NOT NULL DEFAULT 0,
+            total_manual INTEGER NOT NULL DEFAULT 0,
+            total_allocated INTEGER NOT NULL DEFAULT 0,
+            total_consumed INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    _add_column(con, "savings_goals", "allocated", "INTEGER NOT NULL DEFAULT 0")
+    verify_savings_ledger(con, fix=True)
+
+def _m013_month_close(con):
+    # Hasil `flask finance close-month`: progres per bulan (bisa dilanjutkan),
+    # snapshot saldo akun akhir bulan, dan realisasi budget bulan yang ditutup.
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS month_close_runs(
+            month TEXT PRIMARY KEY,
+            started_at TEXT NOT NULL,
+            finished_at TEXT,
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            users_done INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS account_checkpoints(
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            account TEXT NOT NULL,
+            opening INTEGER NOT NULL,
+            flow INTEGER NOT NULL,
+            closing INTEGER NOT NULL,
+            PRIMARY KEY (user_id, month, account)
+        ) WITHOUT ROWID
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS budget_outcomes(
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            budget INTEGER NOT NULL,
+            spent INTEGER NOT NULL,
+            PRIMARY KEY (user_id, month, category_id)
+        ) WITHOUT ROWID
+    """)
+
+def _m014_import_jobs(con):
+    # Job import latar belakang (lihat run_import_job). Baris tervalidasi
+    # ditampung di import_staging per potongan, jadi job yang terputus
+    # dilanjutkan dari potongan terakhir yang tersimpan.
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS import_jobs(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',      -- queued|staging|publishing|done|failed
+            chunks_staged INTEGER NOT NULL DEFAULT 0,
+            rows_staged INTEGER NOT NULL DEFAULT 0,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            heartbeat REAL,                             -- time.time() terakhir dari worker
+            created_at TEXT NOT NULL,
+            finished_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_import_jobs_status ON import_jobs(status)")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS import_staging(
+            job_id INTEGER NOT NULL,
+            chunk INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            type TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            source_or_payee TEXT NOT NULL,
+            account TEXT NOT NULL,
+            notes TEXT NOT NULL,
+            PRIMARY KEY (job_id, chunk, seq)
+        ) WITHOUT ROWID
+    """)
+
+def _m015_transaction_fingerprint(con):
+    # Fingerprint isi transaksi (trx_fingerprint) untuk melewati baris yang
+    # sudah ada saat file yang sama/tumpang tindih diimpor ulang.
+    _add_column(con, "transactions", "fingerprint", "INTEGER")
+    con.create_function("trx_fingerprint", 7, trx_fingerprint, deterministic=True)
+    con.execute("""
+        UPDATE transactions
+           SET fingerprint = trx_fingerprint(date, type, category_id, amount, source_or_payee, account, notes)
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_trx_user_fingerprint ON transactions(user_id, fingerprint)")
+    _add_column(con, "import_jobs", "rows_skipped", "INTEGER NOT NULL DEFAULT 0")
+
+def _m016_import_errors(con):
+    # Laporan validasi per baris (validate_import_frame), disimpan per potongan
+    # seperti import_staging; tetap ada setelah job gagal untuk diunduh.
+    _add_column(con, "import_jobs", "valid_only", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(con, "import_jobs", "rows_invalid", "INTEGER NOT NULL DEFAULT 0")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS import_errors(
+            job_id INTEGER NOT NULL,
+            chunk INTEGER NOT NULL,
+            row INTEGER NOT NULL,
+            field TEXT NOT NULL,
+            value TEXT,
+            message TEXT NOT NULL,
+            PRIMARY KEY (job_id, row, field, message)
+        ) WITHOUT ROWID
+    """)
+
+def _m017_import_job_owner(con):
+    # Token lease worker yang memegang job (claim_import_job); update job
+    # dari worker yang lease-nya sudah diambil alih tidak berlaku.
+    _add_column(con, "import_jobs", "owner", "TEXT")
+
+# (versi, deskripsi, fungsi) — tambahkan di akhir, jangan ubah yang sudah rilis
+MIGRATIONS = [
+    (1, "baseline schema", _m001_baseline),
+    (2, "emoji default kategori bawaan", _m002_default_emojis),
+    (3, "index rentang bulan transaksi & mutasi", _m003_month_range_indexes),
+    (4, "rollup bulanan transaksi", _m004_monthly_rollups),
+    (5, "saldo berjalan per akun", _m005_account_balances),
+    (6, "nominal uang INTEGER (rupiah bulat)", _m006_integer_money),
+    (7, "versi data per user (kunci cache)", _m007_data_version),
+    (8, "full-text search riwayat (FTS5)", _m008_transactions_fts),
+    (9, "index untuk setiap opsi sort riwayat", _m009_history_sort_indexes),
+    (10, "watermark autosave tabungan", _m010_autosave_watermark),
+    (11, "backfill achieved_at goal tabungan", _m011_goal_achieved_backfill),
+    (12, "ringkasan saldo tabungan", _m012_savings_ledger),
+    (13, "tutup bulan: progres, snapshot saldo, realisasi budget", _m013_month_close),
+    (14, "job import latar belakang + staging", _m014_import_jobs),
+    (15, "fingerprint transaksi untuk dedupe import", _m015_transaction_fingerprint),
+    (16, "laporan error import per baris", _m016_import_errors),
+    (17, "token lease worker job import", _m017_import_job_owner),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(con) -> int:
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(target: int | None = None) -> list[int]:
+    """Apply pending migrations once, under an exclusive lock.
+
+    Returns the list of versions applied (empty when already up to date).
+    """
+    conn = connect()
+    conn.isolation_level = None          # transaksi dikontrol manual
+    conn.execute("PRAGMA busy_timeout = 60000")
+    applied = []
+    try:
+        conn.execute("BEGIN EXCLUSIVE")
+        try:
+            # baca ulang di dalam lock: worker lain mungkin sudah selesai migrasi
+            current = schema_version(conn)
+            for version, _desc, fn in MIGRATIONS:
+                if version <= current or (target is not None and version > target):
+                    continue
+                fn(conn)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                applied.append(version)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return applied
+
+def check_schema():
+    """Cheap startup check: compare PRAGMA user_version to SCHEMA_VERSION.
+
+    DB yang tertinggal hanya diberi peringatan; jalankan `flask db upgrade`.
+    Set FINANCE_AUTO_MIGRATE=1 (dev) untuk memigrasi otomatis saat import.
+    """
+    conn = connect()
+    try:
+        current = schema_version(conn)
+    finally:
+        conn.close()
+    if current > SCHEMA_VERSION:
+        app.logger.warning("Skema DB (v%s) lebih baru dari aplikasi (v%s).", current, SCHEMA_VERSION)
+    elif current < SCHEMA_VERSION:
+        if os.getenv("FINANCE_AUTO_MIGRATE", "0") == "1":
+            migrate()
+        else:
+            app.logger.warning(
+                "Skema DB v%s, aplikasi butuh v%s. Jalankan `flask db upgrade`.", current, SCHEMA_VERSION
+            )
 
 # =============================================================================
 # Auth setup
@@ -236,6 +671,7 @@ class User(UserMixin):
         self.id = row["id"]
         self.name = row["name"]
         self.email = row["email"]
+        self.data_version = row["data_version"]
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -243,6 +679,30 @@ def load_user(user_id):
         row = con.execute("SELECT * FROM users WHERE id=?", (user_id,)).fetchone()
         return User(row) if row else None
 
+def bump_data_version(con, user_id: int):
+    """Tandai data user berubah (entri cache dengan versi lama jadi basi)."""
+    con.execute("UPDATE users SET data_version = data_version + 1 WHERE id=?", (user_id,))
+
+@app.after_request
+def _bump_after_write(response):
+    # Hanya POST yang berhasil (bukan 4xx/5xx) dan benar-benar mengubah baris
+    # lewat koneksi request (total_changes naik sejak koneksi diambil);
+    # validasi gagal / tanpa perubahan tidak membuang cache. Data sudah
+    # di-commit oleh route, jadi versi baru tidak pernah mendahului datanya.
+    conn = g.get("_db")
+    if (request.method != "POST" or response.status_code >= 400 or conn is None
+            or conn.total_changes == g.get("db_changes") or not current_user.is_authenticated):
+        return response
+    try:
+        with conn:
+            bump_data_version(conn, current_user.id)
+    except sqlite3.Error:
+        # perubahan sudah tersimpan: jangan jadi 500, cukup buang cache lokal user
+        app.logger.exception("Gagal menaikkan data_version user %s", current_user.id)
+        for cache in (dashboard_cache, history_count_cache):
+            cache.discard_user(current_user.id)
+    return response
+
 def seed_default_categories(user_id: int):
     """Seed kategori default untuk user baru (idempotent)."""
     defaults = {
@@ -274,9 +734,45 @@ def start_end_default():
     e = (s + relativedelta(months=1) - relativedelta(days=1))
     return s.isoformat(), e.isoformat()
 
+# Nominal disimpan sebagai INTEGER rupiah bulat. Semua input (form, file
+# import) dikonversi lewat to_money()/to_money_series() supaya SUM dan
+# perbandingan saldo/budget eksak tanpa epsilon. Rentang yang diterima:
+# |nominal| < MONEY_LIMIT (2**53, batas integer eksak di float64/int64 SQLite).
+MONEY_LIMIT = 2 ** 53
+
+def to_money(value) -> int:
+    """Parse a form/file value into whole rupiah (half-up); ValueError if invalid."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        d = Decimal(value)
+    else:
+        try:
+            d = Decimal(str(value).strip())
+        except (InvalidOperation, ValueError):
+            raise ValueError(f"nominal tidak valid: {value!r}")
+    if not d.is_finite() or abs(d) >= MONEY_LIMIT:
+        raise ValueError(f"nominal tidak valid: {value!r}")
+    return int(d.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def money_ok_mask(s: pd.Series) -> pd.Series:
+    """True untuk nilai numerik yang bisa dikonversi to_money_series."""
+    return s.notna() & np.isfinite(s) & (s.abs() < MONEY_LIMIT)
+
+def to_money_series(s: pd.Series) -> pd.Series:
+    """Vectorized to_money for a numeric Series; ValueError on NaN/inf/out of range.
+
+    Callers that want per-row handling mask with money_ok_mask() first.
+    """
+    s = s.astype("float64")
+    bad = ~money_ok_mask(s)
+    if bad.any():
+        raise ValueError(f"nominal tidak valid: {float(s[bad].iloc[0])!r}")
+    a = s.abs()
+    # di atas 2**52 float64 sudah bulat; +0.5 di sana justru membulatkan ke atas
+    return (np.sign(s) * np.where(a < 2 ** 52, np.floor(a + 0.5), a)).astype("int64")
+
 def money(x):
     """Format angka sebagai Rupiah sederhana (tanpa symbol lokal)."""
-    return f"Rp {x:,.0f}".replace(",", ".")
+    return f"Rp {to_money(x or 0):,}".replace(",", ".")
 app.jinja_env.filters["money"] = money
 
 # Format "YYYY-MM" menjadi "NamaBulan YYYY" (Indonesia)
@@ -325,6 +821,19 @@ app.jinja_env.filters["type_label"] = type_label
 
 VALID_PAYMENTS = {"Transfer", "E-Wallet", "Tunai"}
 
+# Batas panjang teks; dicek di form tambah/edit transaksi & kategori dan di
+# import, jadi data hasil export selalu lolos saat diimpor ulang.
+TEXT_LIMITS = {"category": 50, "source_or_payee": 100, "notes": 255}
+_TEXT_LABELS = {"category": "Nama kategori", "source_or_payee": "Keterangan", "notes": "Catatan"}
+app.jinja_env.globals["TEXT_LIMITS"] = TEXT_LIMITS
+
+def text_limit_error(**fields) -> str | None:
+    """Pesan flash untuk field pertama yang melebihi TEXT_LIMITS (None bila aman)."""
+    for field, value in fields.items():
+        if value and len(value) > TEXT_LIMITS[field]:
+            return f"{_TEXT_LABELS[field]} maksimal {TEXT_LIMITS[field]} karakter."
+    return None
+
 # Only month name (Indonesia) from YYYY-MM
 def month_name_indo(ym: str) -> str:
     try:
@@ -354,51 +863,339 @@ def normalize_date_range(start: str | None, end: str | None):
         s, e = e, s
     return s, e
 
+def month_range(ym: str) -> tuple[str, str]:
+    """'YYYY-MM' -> (awal bulan, awal bulan berikutnya).
 
-# === All-time account balances helper ===
-def account_balances_alltime(user_id: int):
-    """Compute all-time balances per payment account using transactions and
-    internal account_transfers (topup/tarik tunai)."""
-    with db() as con:
-        # From transactions: income adds, expense subtracts
-        trx_rows = con.execute(
+    Dipakai sebagai `date >= ? AND date < ?` supaya query tetap bisa memakai
+    index (user_id, ..., date); filter substr() atas kolom date selalu full scan.
+    """
+    first = datetime.strptime(ym[:7] + "-01", "%Y-%m-%d").date()
+    return first.isoformat(), (first + relativedelta(months=1)).isoformat()
+
+def normalize_month(ym: str | None) -> str:
+    """Validasi 'YYYY-MM'; fallback ke bulan berjalan."""
+    try:
+        month_range(ym or "")
+        return ym[:7]
+    except ValueError:
+        return date.today().strftime("%Y-%m")
+
+
+# =============================================================================
+# Transaction write layer
+# =============================================================================
+# Semua INSERT/UPDATE/DELETE ke `transactions` (dan `account_transfers`) lewat
+# helper di bawah, supaya tabel turunan (monthly_rollups, account_balances)
+# ikut berubah di transaksi DB yang sama.
+
+TRX_FIELDS = ("date", "type", "category_id", "amount", "source_or_payee", "account", "notes")
+
+# cat_sort = nama kategori yang didenormalisasi untuk index sort riwayat;
+# rename kategori disinkronkan trigger category_sort_rename.
+_TRX_INSERT_SQL = """
+    INSERT INTO transactions(user_id,date,type,category_id,amount,source_or_payee,account,notes,fingerprint,cat_sort)
+    VALUES (?,?,?,?,?,?,?,?,?, COALESCE((SELECT name FROM categories WHERE id=?), ''))
+"""
+
+def trx_fingerprint(date_, type_, category_id, amount, source_or_payee, account, notes) -> int:
+    """Hash 64-bit (bertanda, muat di INTEGER SQLite) dari isi transaksi; kunci dedupe import.
+
+    Kategori diwakili id-nya, jadi rename kategori tidak mengubah fingerprint.
+    """
+    key = "\x1f".join((str(date_), str(type_), str(category_id), str(int(amount)),
+                       source_or_payee or "", account or "", notes or ""))
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True)
+
+def _trx_params(user_id: int, r: dict) -> tuple:
+    # akun kosong disimpan '' (bukan NULL) supaya bisa jadi kunci sort/cursor
+    return (user_id, r["date"], r["type"], r["category_id"], r["amount"],
+            r["source_or_payee"], r["account"] or "", r["notes"],
+            trx_fingerprint(*(r[f] for f in TRX_FIELDS)), r["category_id"])
+
+def _balance_adjust(con, user_id: int, deltas: dict):
+    """Tambahkan delta ke saldo berjalan per akun (hanya VALID_PAYMENTS)."""
+    params = [(user_id, acc, d) for acc, d in deltas.items() if acc in VALID_PAYMENTS and d]
+    if params:
+        con.executemany(
             """
-            SELECT account AS acc,
-                   SUM(CASE WHEN type='income' THEN amount ELSE -amount END) AS saldo
-            FROM transactions
-            WHERE user_id=? AND account IN ('Transfer','Tunai','E-Wallet')
-            GROUP BY account
+            INSERT INTO account_balances(user_id, account, balance, version) VALUES (?,?,?,1)
+            ON CONFLICT(user_id, account)
+            DO UPDATE SET balance = balance + excluded.balance, version = version + 1
             """,
-            (user_id,)
-        ).fetchall()
-
-        base = {'Transfer': 0.0, 'Tunai': 0.0, 'E-Wallet': 0.0}
-        for r in trx_rows:
-            if r['acc'] in base:
-                base[r['acc']] = float(r['saldo'] or 0)
+            params
+        )
 
-        # Internal transfers
-        inc_rows = con.execute(
+def _trx_apply(con, user_id: int, rows, sign: int):
+    """Fold transaction rows into derived tables (+1 = added, -1 = removed)."""
+    buckets = {}
+    balances = {}
+    for r in rows:
+        key = (r["date"][:7], r["type"], r["category_id"], r["account"] or "")
+        total, count = buckets.get(key, (0, 0))
+        buckets[key] = (total + r["amount"], count + 1)
+        flow = r["amount"] if r["type"] == "income" else -r["amount"]
+        balances[r["account"]] = balances.get(r["account"], 0) + sign * flow
+    _trx_apply_buckets(con, user_id, buckets, balances, sign)
+
+def _trx_apply_buckets(con, user_id: int, buckets: dict, balances: dict, sign: int):
+    """buckets: {(bulan, type, category_id, akun): (total, count)} tanpa tanda;
+    balances: {akun: delta saldo} sudah bertanda."""
+    if not buckets:
+        return
+    _balance_adjust(con, user_id, balances)
+    con.executemany(
+        """
+        INSERT INTO monthly_rollups(user_id, month, type, category_id, account, total, count)
+        VALUES (?,?,?,?,?,?,?)
+        ON CONFLICT(user_id, month, type, category_id, account)
+        DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+        """,
+        [(user_id, *key, sign * total, sign * count) for key, (total, count) in buckets.items()]
+    )
+    if sign < 0:
+        con.executemany(
             """
-            SELECT to_account AS acc, SUM(amount) AS s
-            FROM account_transfers WHERE user_id=? GROUP BY to_account
+            DELETE FROM monthly_rollups
+            WHERE user_id=? AND month=? AND type=? AND category_id=? AND account=? AND count<=0
             """,
-            (user_id,)
-        ).fetchall()
-        out_rows = con.execute(
+            [(user_id, *key) for key in buckets]
+        )
+    # bulan yang sudah lewat bisa jadi sudah difinalisasi autosave/tutup bulan
+    this_month = date.today().strftime("%Y-%m")
+    past = sorted({key[0] for key in buckets if key[0] < this_month})
+    if past:
+        con.executemany(
+            "INSERT OR IGNORE INTO savings_dirty_months(user_id, month) VALUES (?,?)",
+            [(user_id, m) for m in past]
+        )
+        con.executemany("DELETE FROM budget_outcomes WHERE user_id=? AND month=?", [(user_id, m) for m in past])
+        _invalidate_checkpoints(con, user_id, past[0])
+
+def _invalidate_checkpoints(con, user_id: int, month: str):
+    """Snapshot saldo bulan >= month basi karena ada tulisan mundur (backdated)."""
+    if month < date.today().strftime("%Y-%m"):
+        con.execute("DELETE FROM account_checkpoints WHERE user_id=? AND month>=?", (user_id, month))
+
+def trx_insert(con, user_id: int, date_, type_, category_id, amount,
+               source_or_payee=None, account=None, notes=None) -> int:
+    """Insert one transaction and return its id."""
+    row = {"date": date_, "type": type_, "category_id": category_id, "amount": amount,
+           "source_or_payee": source_or_payee, "account": account, "notes": notes}
+    cur = con.execute(_TRX_INSERT_SQL, _trx_params(user_id, row))
+    _trx_apply(con, user_id, [row], +1)
+    return cur.lastrowid
+
+def trx_insert_many(con, user_id: int, rows: list[dict]) -> int:
+    """Bulk insert (rows: dict dengan key TRX_FIELDS); rollup diagregasi sekali."""
+    con.executemany(_TRX_INSERT_SQL, [_trx_params(user_id, r) for r in rows])
+    _trx_apply(con, user_id, rows, +1)
+    return len(rows)
+
+def import_fingerprints(df: pd.DataFrame) -> list[int]:
+    """trx_fingerprint untuk setiap baris DataFrame (kolom TRX_FIELDS)."""
+    return [trx_fingerprint(*r) for r in zip(*(df[f].tolist() for f in TRX_FIELDS))]
+
+def trx_insert_frame(con, user_id: int, df: pd.DataFrame) -> int:
+    """Bulk insert dari DataFrame tervalidasi (kolom TRX_FIELDS).
+
+    Parameter executemany dirakit dari array kolom, dan rollup/saldo
+    diagregasi dengan groupby, jadi tidak ada dict per baris.
+    """
+    if df.empty:
+        return 0
+    cat_ids = df["category_id"].tolist()
+    fps = df["fingerprint"].tolist() if "fingerprint" in df else import_fingerprints(df)
+    con.executemany(_TRX_INSERT_SQL, zip(
+        [user_id] * len(df), df["date"].tolist(), df["type"].tolist(), cat_ids, df["amount"].tolist(),
+        df["source_or_payee"].tolist(), df["account"].tolist(), df["notes"].tolist(), fps, cat_ids,
+    ))
+    grouped = (df.assign(month=df["date"].str[:7])
+                 .groupby(["month", "type", "category_id", "account"])["amount"].agg(["sum", "count"]))
+    buckets = {(m, t, int(c), a): (int(total), int(count))
+               for (m, t, c, a), total, count in zip(grouped.index, grouped["sum"], grouped["count"])}
+    flow = df["amount"].where(df["type"] == "income", -df["amount"])
+    balances = {a: int(v) for a, v in flow.groupby(df["account"]).sum().items()}
+    _trx_apply_buckets(con, user_id, buckets, balances, +1)
+    return len(df)
+
+def trx_update(con, user_id: int, trx_id: int, **changes) -> bool:
+    """Update fields of one transaction; False if it doesn't belong to user."""
+    old = con.execute(
+        "SELECT * FROM transactions WHERE id=? AND user_id=?", (trx_id, user_id)
+    ).fetchone()
+    if not old:
+        return False
+    new = {f: changes.get(f, old[f]) for f in TRX_FIELDS}
+    con.execute(
+        """
+        UPDATE transactions
+           SET date=?, type=?, category_id=?, amount=?, source_or_payee=?, account=?, notes=?,
+               fingerprint=?, cat_sort=COALESCE((SELECT name FROM categories WHERE id=?), '')
+         WHERE id=? AND user_id=?
+        """,
+        (*_trx_params(user_id, new)[1:], trx_id, user_id)
+    )
+    _trx_apply(con, user_id, [old], -1)
+    _trx_apply(con, user_id, [new], +1)
+    return True
+
+def trx_delete(con, user_id: int, trx_id: int) -> bool:
+    old = con.execute(
+        "SELECT * FROM transactions WHERE id=? AND user_id=?", (trx_id, user_id)
+    ).fetchone()
+    if not old:
+        return False
+    con.execute("DELETE FROM transactions WHERE id=? AND user_id=?", (trx_id, user_id))
+    _trx_apply(con, user_id, [old], -1)
+    return True
+
+def transfer_insert(con, user_id: int, date_, from_account, to_account, amount, note=None) -> int:
+    """Catat mutasi antar akun dan sesuaikan saldo kedua akun."""
+    cur = con.execute(
+        """
+        INSERT INTO account_transfers(user_id,date,from_account,to_account,amount,note)
+        VALUES (?,?,?,?,?,?)
+        """,
+        (user_id, date_, from_account, to_account, amount, note),
+    )
+    _balance_adjust(con, user_id, {from_account: -amount, to_account: amount})
+    _invalidate_checkpoints(con, user_id, date_[:7])
+    return cur.lastrowid
+
+def transfer_delete(con, user_id: int, transfer_id: int) -> bool:
+    tr = con.execute(
+        "SELECT date, from_account, to_account, amount FROM account_transfers WHERE id=? AND user_id=?",
+        (transfer_id, user_id)
+    ).fetchone()
+    if not tr:
+        return False
+    con.execute("DELETE FROM account_transfers WHERE id=? AND user_id=?", (transfer_id, user_id))
+    _balance_adjust(con, user_id, {tr["from_account"]: tr["amount"], tr["to_account"]: -tr["amount"]})
+    _invalidate_checkpoints(con, user_id, tr["date"][:7])
+    return True
+
+def rebuild_rollups(con, user_id: int | None = None):
+    """Hitung ulang monthly_rollups dari transactions (backfill/perbaikan)."""
+    where, params = ("WHERE user_id=?", (user_id,)) if user_id is not None else ("", ())
+    con.execute(f"DELETE FROM monthly_rollups {where}", params)
+    con.execute(
+        f"""
+        INSERT INTO monthly_rollups(user_id, month, type, category_id, account, total, count)
+        SELECT user_id, substr(date,1,7), type, category_id, COALESCE(account,''),
+               SUM(amount), COUNT(*)
+        FROM transactions {where}
+        GROUP BY user_id, substr(date,1,7), type, category_id, COALESCE(account,'')
+        """,
+        params
+    )
+
+def account_balances_from_source(con, user_id: int | None = None) -> dict:
+    """{(user_id, account): saldo} dihitung ulang dari transactions + account_transfers."""
+    where, params = ("AND user_id=?", (user_id,)) if user_id is not None else ("", ())
+    rows = con.execute(
+        f"""
+        SELECT user_id, acc, SUM(flow) AS saldo FROM (
+            SELECT user_id, account AS acc,
+                   CASE WHEN type='income' THEN amount ELSE -amount END AS flow
+            FROM transactions WHERE account IN ('Transfer','Tunai','E-Wallet') {where}
+            UNION ALL
+            SELECT user_id, to_account, amount FROM account_transfers WHERE 1=1 {where}
+            UNION ALL
+            SELECT user_id, from_account, -amount FROM account_transfers WHERE 1=1 {where}
+        )
+        GROUP BY user_id, acc
+        """,
+        params * 3
+    ).fetchall()
+    return {(r["user_id"], r["acc"]): int(r["saldo"] or 0) for r in rows}
+
+def verify_account_balances(con, user_id: int | None = None, fix: bool = False) -> list[dict]:
+    """Compare account_balances with a recomputation from source.
+
+    Returns one dict per drifting (user_id, account); with fix=True the
+    stored balance is overwritten by the recomputed one.
+    """
+    where, params = ("WHERE user_id=?", (user_id,)) if user_id is not None else ("", ())
+    stored = {
+        (r["user_id"], r["account"]): int(r["balance"])
+        for r in con.execute(f"SELECT user_id, account, balance FROM account_balances {where}", params)
+    }
+    expected = account_balances_from_source(con, user_id)
+    drift = []
+    for key in sorted(set(stored) | set(expected)):
+        have, want = stored.get(key, 0), expected.get(key, 0)
+        if have != want:
+            drift.append({"user_id": key[0], "account": key[1], "stored": have, "expected": want})
+    if fix and drift:
+        con.executemany(
             """
-            SELECT from_account AS acc, SUM(amount) AS s
-            FROM account_transfers WHERE user_id=? GROUP BY from_account
+            INSERT INTO account_balances(user_id, account, balance, version) VALUES (?,?,?,1)
+            ON CONFLICT(user_id, account)
+            DO UPDATE SET balance = excluded.balance, version = version + 1
             """,
+            [(d["user_id"], d["account"], d["expected"]) for d in drift]
+        )
+    return drift
+
+def month_totals(con, user_id: int, ym: str) -> tuple[int, int]:
+    """(income, expense) satu bulan dari monthly_rollups."""
+    row = con.execute(
+        """
+        SELECT
+          SUM(CASE WHEN type='income'  THEN total ELSE 0 END) AS inc,
+          SUM(CASE WHEN type='expense' THEN total ELSE 0 END) AS exp
+        FROM monthly_rollups
+        WHERE user_id=? AND month=?
+        """,
+        (user_id, ym)
+    ).fetchone()
+    return int(row["inc"] or 0), int(row["exp"] or 0)
+
+def rebuild_search_index(con, user_id: int | None = None):
+    """Isi ulang transactions_fts dari transactions (backfill/perbaikan)."""
+    if user_id is None:
+        con.execute("DELETE FROM transactions_fts")
+        where, params = "", ()
+    else:
+        con.execute("DELETE FROM transactions_fts WHERE rowid IN (SELECT id FROM transactions WHERE user_id=?)", (user_id,))
+        where, params = "WHERE t.user_id=?", (user_id,)
+    con.execute(
+        f"""
+        INSERT INTO transactions_fts(rowid, payee, notes, category, user_id)
+        SELECT t.id, t.source_or_payee, t.notes, c.name, t.user_id
+        FROM transactions t LEFT JOIN categories c ON c.id=t.category_id
+        {where}
+        """,
+        params
+    )
+
+def search_match_query(q: str | None) -> str | None:
+    """Input bebas -> query MATCH FTS5 yang aman: setiap kata jadi prefix
+    ("kopi"* "kenang"*), digabung AND. None bila tidak ada kata."""
+    words = re.findall(r"\w+", q or "")[:8]
+    return " ".join(f'"{w}"*' for w in words) or None
+
+def whole_months(start: str, end: str) -> tuple[str, str] | None:
+    """(bulan awal, bulan akhir) bila [start, end] tepat menutup bulan penuh."""
+    s, e = date.fromisoformat(start), date.fromisoformat(end)
+    if s.day != 1 or (e + relativedelta(days=1)).day != 1:
+        return None
+    return s.strftime("%Y-%m"), e.strftime("%Y-%m")
+
+# === All-time account balances helper ===
+def account_balances_alltime(user_id: int):
+    """All-time balances per payment account (transactions + internal
+    account_transfers), read from the running account_balances ledger."""
+    with db() as con:
+        rows = con.execute(
+            "SELECT account AS acc, balance FROM account_balances WHERE user_id=?",
             (user_id,)
         ).fetchall()
 
-        for r in inc_rows:
-            if r['acc'] in base:
-                base[r['acc']] += float(r['s'] or 0)
-        for r in out_rows:
-            if r['acc'] in base:
-                base[r['acc']] -= float(r['s'] or 0)
+    base = {'Transfer': 0, 'Tunai': 0, 'E-Wallet': 0}
+    for r in rows:
+        if r['acc'] in base:
+            base[r['acc']] = int(r['balance'] or 0)
 
     def _label(a: str) -> str:
         return 'Rekening' if a == 'Transfer' else ('E-Wallet' if a == 'E-Wallet' else 'Tunai')
@@ -411,48 +1208,46 @@ def account_balances_alltime(user_id: int):
 
 
 def account_balances_month(user_id: int, ym: str):
-    """Compute balances per account limited to given month (YYYY-MM)."""
-    with db() as con:
-        trx_rows = con.execute(
-            """
-            SELECT account AS acc,
-                   SUM(CASE WHEN type='income' THEN amount ELSE -amount END) AS saldo
-            FROM transactions
-            WHERE user_id=? AND account IN ('Transfer','Tunai','E-Wallet')
-              AND substr(date,1,7)=?
-            GROUP BY account
-            """,
-            (user_id, ym)
-        ).fetchall()
+    """Saldo per akun untuk bulan `ym`: opening (awal bulan), flow (arus di
+    bulan itu), closing (akhir bulan) — satu query UNION ALL.
 
-        base = {'Transfer': 0.0, 'Tunai': 0.0, 'E-Wallet': 0.0}
-        for r in trx_rows:
-            if r['acc'] in base:
-                base[r['acc']] = float(r['saldo'] or 0)
-
-        inc_rows = con.execute(
-            """
-            SELECT to_account AS acc, SUM(amount) AS s
-            FROM account_transfers WHERE user_id=? AND substr(date,1,7)=?
-            GROUP BY to_account
-            """,
-            (user_id, ym)
-        ).fetchall()
-        out_rows = con.execute(
-            """
-            SELECT from_account AS acc, SUM(amount) AS s
-            FROM account_transfers WHERE user_id=? AND substr(date,1,7)=?
-            GROUP BY from_account
+    Opening diambil dari snapshot account_checkpoints terdekat sebelum `ym`
+    (hasil `flask finance close-month`), ditambah arus sesudah snapshot itu;
+    tanpa snapshot, arus dihitung dari awal histori.
+    """
+    m_start, m_end = month_range(ym)
+    cp = "(SELECT MAX(month) FROM account_checkpoints WHERE user_id=? AND month<?)"
+    cp_end = f"COALESCE(date({cp} || '-01', '+1 month'), '')"
+    with db() as con:
+        rows = con.execute(
+            f"""
+            SELECT acc, SUM(CASE WHEN before THEN amt ELSE 0 END) AS opening,
+                   SUM(CASE WHEN before THEN 0 ELSE amt END) AS flow
+            FROM (
+                SELECT account AS acc, closing AS amt, 1 AS before
+                FROM account_checkpoints WHERE user_id=? AND month={cp}
+                UNION ALL
+                SELECT account, CASE WHEN type='income' THEN total ELSE -total END, month<?
+                FROM monthly_rollups WHERE user_id=? AND month<=? AND month>COALESCE({cp}, '')
+                UNION ALL
+                SELECT to_account, amount, date<?
+                FROM account_transfers WHERE user_id=? AND date<? AND date>={cp_end}
+                UNION ALL
+                SELECT from_account, -amount, date<?
+                FROM account_transfers WHERE user_id=? AND date<? AND date>={cp_end}
+            )
+            WHERE acc IN ('Transfer','Tunai','E-Wallet')
+            GROUP BY acc
             """,
-            (user_id, ym)
+            (user_id, user_id, ym,
+             ym, user_id, ym, user_id, ym,
+             m_start, user_id, m_end, user_id, ym,
+             m_start, user_id, m_end, user_id, ym)
         ).fetchall()
 
-        for r in inc_rows:
-            if r['acc'] in base:
-                base[r['acc']] += float(r['s'] or 0)
-        for r in out_rows:
-            if r['acc'] in base:
-                base[r['acc']] -= float(r['s'] or 0)
+    base = {'Transfer': (0, 0), 'Tunai': (0, 0), 'E-Wallet': (0, 0)}
+    for r in rows:
+        base[r['acc']] = (int(r['opening'] or 0), int(r['flow'] or 0))
 
     def _label(a: str) -> str:
         return 'Rekening' if a == 'Transfer' else ('E-Wallet' if a == 'E-Wallet' else 'Tunai')
@@ -460,8 +1255,21 @@ def account_balances_month(user_id: int, ym: str):
     return [{
         'acc': k,
         'label': _label(k),
-        'saldo': v,
-    } for k, v in base.items()]
+        'opening': o,
+        'flow': f,
+        'closing': o + f,
+    } for k, (o, f) in base.items()]
+
+def transfer_available(user_id: int, account: str, ym: str) -> int:
+    """Saldo `account` yang boleh dipakai mutasi menurut TRANSFER_BALANCE_POLICY."""
+    policy = app.config["TRANSFER_BALANCE_POLICY"]
+    if policy == "alltime":
+        bals = account_balances_alltime(user_id)
+        key = "saldo"
+    else:
+        bals = account_balances_month(user_id, ym)
+        key = "flow" if policy == "month" else "closing"
+    return next((b[key] for b in bals if b["acc"] == account), 0)
 
 
 # =============================================================================
@@ -520,55 +1328,234 @@ def logout():
 
 
 # =============================================================================
-# Main pages
+# Result cache
 # =============================================================================
 
-@app.get("/")
-@app.get("/dashboard")
-@login_required
-def dashboard():
-    # range tanggal aman
-    start, end = normalize_date_range(request.args.get("start"), request.args.get("end"))
+_shared_cache = threading.local()
 
-    with db() as con:
-        totals = con.execute("""
-            SELECT
-              SUM(CASE WHEN t.type='income'  THEN t.amount ELSE 0 END) AS income,
-              SUM(CASE WHEN t.type='expense' THEN t.amount ELSE 0 END) AS expense
-            FROM transactions t
-            WHERE t.user_id=? AND t.date BETWEEN ? AND ?
-        """, (current_user.id, start, end)).fetchone()
+class ResultCache:
+    """Bounded in-process LRU keyed by (user_id, data_version, *parts).
 
-        spend = con.execute("""
-            SELECT c.name AS category, c.id AS category_id, SUM(t.amount) AS total
-            FROM transactions t
-            JOIN categories c ON c.id=t.category_id
-            WHERE t.user_id=? AND t.type='expense' AND t.date BETWEEN ? AND ?
-            GROUP BY c.id, c.name
-            ORDER BY total DESC
-        """, (current_user.id, start, end)).fetchall()
+    Bila SHARED_CACHE_DB diset, miss lokal dicek ke file SQLite bersama
+    sehingga worker lain ikut memakai hasil yang sudah dihitung. Nilai harus
+    bisa di-JSON-kan. Kegagalan tier bersama hanya dicatat di log.
+    """
 
-        top_payee = con.execute("""
-            SELECT COALESCE(source_or_payee,'(Tidak diisi)') AS payee,
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.shared_hits = self.misses = 0
+
+    def get(self, user_id: int, version: int, *parts):
+        if self.maxsize <= 0:
+            return None
+        key = (user_id, version, *parts)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+        value = self._shared_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+        self._put_local(key, value)
+        return value
+
+    def put(self, user_id: int, version: int, *parts, value):
+        if self.maxsize <= 0:
+            return
+        key = (user_id, version, *parts)
+        self._put_local(key, value)
+        self._shared_put(key, value)
+
+    def discard_user(self, user_id: int):
+        """Buang entri lokal milik user (dipakai bila data_version gagal dinaikkan)."""
+        with self._lock:
+            for key in [k for k in self._data if k[0] == user_id]:
+                del self._data[key]
+
+    def _put_local(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.shared_hits) / lookups, 3) if lookups else None,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "shared": bool(app.config["SHARED_CACHE_DB"]),
+            }
+
+    # --- tier bersama (SQLite) ---
+
+    def _shared_conn(self):
+        path = app.config["SHARED_CACHE_DB"]
+        if not path:
+            return None
+        conns = getattr(_shared_cache, "conns", None)
+        if conns is None:
+            conns = _shared_cache.conns = {}
+        conn = conns.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")    # isinya bisa dihitung ulang
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS result_cache(
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    version INTEGER NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (name, key)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_user ON result_cache(name, user_id, version)")
+            conns[path] = conn
+        return conn
+
+    def _shared_get(self, key):
+        try:
+            conn = self._shared_conn()
+            if conn is None:
+                return None
+            row = conn.execute(
+                "SELECT value FROM result_cache WHERE name=? AND key=?", (self.name, json.dumps(key))
+            ).fetchone()
+            return json.loads(row[0]) if row else None
+        except sqlite3.Error as e:
+            app.logger.warning("Shared cache %s tidak bisa dibaca: %s", self.name, e)
+            return None
+
+    def _shared_put(self, key, value):
+        try:
+            conn = self._shared_conn()
+            if conn is None:
+                return
+            user_id, version = key[0], key[1]
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO result_cache(name, key, user_id, version, value) VALUES (?,?,?,?,?)",
+                    (self.name, json.dumps(key), user_id, version, json.dumps(value))
+                )
+                # entri versi lama milik user ini tidak akan pernah dibaca lagi
+                conn.execute(
+                    "DELETE FROM result_cache WHERE name=? AND user_id=? AND version<?",
+                    (self.name, user_id, version)
+                )
+        except sqlite3.Error as e:
+            app.logger.warning("Shared cache %s tidak bisa ditulis: %s", self.name, e)
+
+dashboard_cache = ResultCache("dashboard", app.config["DASHBOARD_CACHE_SIZE"])
+history_count_cache = ResultCache("history_count", app.config["DASHBOARD_CACHE_SIZE"])
+
+
+# =============================================================================
+# Main pages
+# =============================================================================
+
+def period_aggregates(con, user_id: int, start: str, end: str) -> dict:
+    """Agregat dashboard untuk [start, end]: total, spend per kategori, top payee.
+
+    Irisan transaksi cukup dibaca sekali. Periode bulan penuh mengambil
+    total + per kategori dari monthly_rollups (satu query) dan hanya payee
+    yang dihitung dari transaksi; periode lain memakai satu GROUP BY
+    (type, category, payee) lalu dilipat di Python (jumlah grup jauh lebih
+    kecil dari jumlah baris).
+    """
+    months = whole_months(start, end)
+    if months:
+        cat_rows = con.execute("""
+            SELECT r.type, r.category_id, c.name AS category, SUM(r.total) AS total
+            FROM monthly_rollups r
+            LEFT JOIN categories c ON c.id=r.category_id
+            WHERE r.user_id=? AND r.month BETWEEN ? AND ?
+            GROUP BY r.type, r.category_id
+        """, (user_id, *months)).fetchall()
+        payee_rows = con.execute("""
+            SELECT 'expense' AS type, COALESCE(source_or_payee,'(Tidak diisi)') AS payee,
                    SUM(amount) AS total, COUNT(*) AS cnt
             FROM transactions
             WHERE user_id=? AND type='expense' AND date BETWEEN ? AND ?
-            GROUP BY COALESCE(source_or_payee,'(Tidak diisi)')
-            ORDER BY total DESC LIMIT 1
-        """, (current_user.id, start, end)).fetchone()
+            GROUP BY payee
+        """, (user_id, start, end)).fetchall()
+    else:
+        cat_rows = payee_rows = con.execute("""
+            WITH agg AS (
+                SELECT type, category_id,
+                       COALESCE(source_or_payee,'(Tidak diisi)') AS payee,
+                       SUM(amount) AS total, COUNT(*) AS cnt
+                FROM transactions
+                WHERE user_id=? AND date BETWEEN ? AND ?
+                GROUP BY type, category_id, payee
+            )
+            SELECT agg.*, c.name AS category
+            FROM agg LEFT JOIN categories c ON c.id=agg.category_id
+        """, (user_id, start, end)).fetchall()
+
+    totals = {"income": 0, "expense": 0}
+    by_cat, by_payee = {}, {}
+    for r in cat_rows:
+        totals[r["type"]] += r["total"]
+        # kategori yang sudah dihapus tetap dihitung di total, tapi tidak di chart
+        if r["type"] == "expense" and r["category"] is not None:
+            cat = by_cat.setdefault(r["category_id"], {"category": r["category"], "category_id": r["category_id"], "total": 0})
+            cat["total"] += r["total"]
+    for r in payee_rows:
+        if r["type"] == "expense":
+            p = by_payee.setdefault(r["payee"], {"payee": r["payee"], "total": 0, "cnt": 0})
+            p["total"] += r["total"]
+            p["cnt"] += r["cnt"]
+
+    return {
+        "income": int(totals["income"]),
+        "expense": int(totals["expense"]),
+        "spend_by_cat": sorted(by_cat.values(), key=lambda c: c["total"], reverse=True),
+        "spent_by_cat": {cid: c["total"] for cid, c in by_cat.items()},
+        "top_payee": max(by_payee.values(), key=lambda p: p["total"], default=None),
+    }
+
+def dashboard_context(user_id: int, start: str, end: str) -> dict:
+    """Data dashboard untuk periode [start, end] (tanpa request; bisa di-cache)."""
+    month = start[:7]
+
+    with db() as con:
+        agg = period_aggregates(con, user_id, start, end)
 
-        # budgets (berdasarkan bulan dari start)
-        month = start[:7]
+        # budgets (berdasarkan bulan dari start). Kalau periode = bulan itu,
+        # spent diambil dari hasil agregasi di atas; selain itu dari rollup.
         budgets = con.execute("""
-            SELECT b.id, c.name AS category, b.amount,
-                   COALESCE( (SELECT SUM(amount) FROM transactions
-                             WHERE user_id=b.user_id AND type='expense' AND category_id=b.category_id
-                               AND substr(date,1,7)=b.month), 0) AS spent
+            SELECT b.id, b.category_id, c.name AS category, b.amount
             FROM budgets b
             JOIN categories c ON c.id=b.category_id
             WHERE b.user_id=? AND b.month=?
             ORDER BY c.name
-        """, (current_user.id, month)).fetchall()
+        """, (user_id, month)).fetchall()
+        if whole_months(start, end) == (month, month):
+            spent_by_cat = agg["spent_by_cat"]
+        else:
+            spent_by_cat = {
+                r["category_id"]: r["spent"]
+                for r in con.execute("""
+                    SELECT category_id, SUM(total) AS spent
+                    FROM monthly_rollups
+                    WHERE user_id=? AND month=? AND type='expense'
+                    GROUP BY category_id
+                """, (user_id, month))
+            } if budgets else {}
 
         # latest transaksi (LEFT JOIN agar tanpa kategori tetap tampil)
         latest = con.execute("""
@@ -582,43 +1569,51 @@ def dashboard():
             WHERE t.user_id=? AND t.date BETWEEN ? AND ?
             ORDER BY t.date DESC, t.id DESC
             LIMIT 10
-        """, (current_user.id, start, end)).fetchall()
+        """, (user_id, start, end)).fetchall()
 
         # Active savings goals (ringkas untuk dashboard)
         goals_rows = con.execute(
             """
-            SELECT g.id, g.name, g.target_amount,
-                   COALESCE(SUM(a.amount),0) AS allocated
-            FROM savings_goals g
-            LEFT JOIN savings_allocations a ON a.goal_id=g.id AND a.user_id=g.user_id
-            WHERE g.user_id=? AND g.archived_at IS NULL
-            GROUP BY g.id
-            ORDER BY g.created_at DESC
+            SELECT id, name, target_amount, allocated
+            FROM savings_goals
+            WHERE user_id=? AND archived_at IS NULL
+            ORDER BY created_at DESC
             LIMIT 6
             """,
-            (current_user.id,)
+            (user_id,)
         ).fetchall()
 
-    summary = {
-        "income": float(totals["income"] or 0),
-        "expense": float(totals["expense"] or 0),
-    }
+    summary = {"income": agg["income"], "expense": agg["expense"]}
     summary["net"] = summary["income"] - summary["expense"]
 
     # siapkan flag kategori yang over-budget
-    budgets_py = [dict(b) for b in budgets]
-    over_budgets = [b for b in budgets_py if float(b.get("amount") or 0) > 0 and float(b.get("spent") or 0) > float(b.get("amount") or 0)]
+    budgets_py = [dict(b, spent=spent_by_cat.get(b["category_id"], 0)) for b in budgets]
+    over_budgets = [b for b in budgets_py if (b.get("amount") or 0) > 0 and (b.get("spent") or 0) > (b.get("amount") or 0)]
+
+    return {
+        "summary": summary,
+        "spend_by_cat": agg["spend_by_cat"],
+        "top_payee": agg["top_payee"],
+        "budgets": budgets_py,
+        "over_budgets": over_budgets,
+        "latest": [dict(r) for r in latest],
+        "active_goals": [dict(r) for r in goals_rows],
+    }
 
-    return render_template(
-        "dashboard.html",
-        start=start, end=end, summary=summary,
-        spend_by_cat=[dict(r) for r in spend],
-        top_payee=dict(top_payee) if top_payee else None,
-        budgets=budgets_py,
-        over_budgets=over_budgets,
-        latest=[dict(r) for r in latest],
-        active_goals=[dict(r) for r in goals_rows],
-    )
+@app.get("/")
+@app.get("/dashboard")
+@login_required
+def dashboard():
+    # range tanggal aman
+    start, end = normalize_date_range(request.args.get("start"), request.args.get("end"))
+
+    # data_version ikut di kunci: setiap POST yang mengubah data menaikkan versi -> entri lama basi
+    ctx = dashboard_cache.get(current_user.id, current_user.data_version, start, end)
+    if ctx is None:
+        ctx = dashboard_context(current_user.id, start, end)
+        dashboard_cache.put(current_user.id, current_user.data_version, start, end, value=ctx)
+
+    return render_template("dashboard.html", start=start, end=end, **ctx)
 
 
 # =============================================================================
@@ -628,18 +1623,19 @@ def dashboard():
 @app.get("/accounts")
 @login_required
 def accounts_page():
-    month = request.args.get("month") or date.today().strftime("%Y-%m")
+    month = normalize_month(request.args.get("month"))
     balances = account_balances_month(current_user.id, month)
+    m_start, m_end = month_range(month)
     with db() as con:
         rows = con.execute(
             """
             SELECT id, date, from_account, to_account, amount, note
             FROM account_transfers
-            WHERE user_id=? AND substr(date,1,7)=?
+            WHERE user_id=? AND date >= ? AND date < ?
             ORDER BY id DESC
             LIMIT 20
             """,
-            (current_user.id, month)
+            (current_user.id, m_start, m_end)
         ).fetchall()
     return render_template(
         "accounts.html",
@@ -668,8 +1664,7 @@ def account_transfer_delete(transfer_id: int):
         # Delete linked admin fee transaction if any; fallback: attempt to find it
         fee_deleted = False
         if fee_tx_id:
-            con.execute("DELETE FROM transactions WHERE id=? AND user_id=?", (fee_tx_id, current_user.id))
-            fee_deleted = True
+            fee_deleted = trx_delete(con, current_user.id, fee_tx_id)
         else:
             # Fallback heuristic: match by date/account/category/name
             # Build expected description
@@ -694,11 +1689,10 @@ def account_transfer_delete(transfer_id: int):
                 (current_user.id, tr["date"], tr["from_account"], desc)
             ).fetchone()
             if row:
-                con.execute("DELETE FROM transactions WHERE id=? AND user_id=?", (row["id"], current_user.id))
-                fee_deleted = True
+                fee_deleted = trx_delete(con, current_user.id, row["id"])
 
         # Finally, remove transfer itself
-        con.execute("DELETE FROM account_transfers WHERE id=? AND user_id=?", (transfer_id, current_user.id))
+        transfer_delete(con, current_user.id, transfer_id)
 
     flash("Mutasi dihapus." + (" Biaya admin ikut dihapus." if fee_deleted else ""), "danger")
     return redirect(next_url)
@@ -717,7 +1711,8 @@ def import_export():
     end_default = today.isoformat()
     start = request.args.get("start", start_default)
     end = request.args.get("end", end_default)
-    return render_template("import_export.html", title="Import & Export", start=start, end=end)
+    return render_template("import_export.html", title="Import & Export", start=start, end=end,
+                           job_id=request.args.get("job", type=int))
 
 
 # =============================================================================
@@ -800,13 +1795,18 @@ def add_submit():
         return redirect(url_for("add_form", type=type_))
 
     try:
-        amt = float(amount)
+        amt = to_money(amount)
         if amt <= 0:
             raise ValueError
     except:
         flash("Nominal harus angka positif.")
         return redirect(url_for("add_form", type=type_))
 
+    err = text_limit_error(source_or_payee=keterangan, notes=notes)
+    if err:
+        flash(err)
+        return redirect(url_for("add_form", type=type_))
+
     # pastikan kategori milik user & sesuai type
     with db() as con:
         cat = con.execute(
@@ -817,10 +1817,7 @@ def add_submit():
             flash("Kategori tidak ditemukan / tidak sesuai jenis.")
             return redirect(url_for("add_form", type=type_))
 
-        con.execute("""
-            INSERT INTO transactions(user_id,date,type,category_id,amount,source_or_payee,account,notes)
-            VALUES (?,?,?,?,?,?,?,?)
-        """, (current_user.id, date_, type_, cat_id_int, amt, keterangan, payment, notes))
+        trx_insert(con, current_user.id, date_, type_, cat_id_int, amt, keterangan, payment, notes)
 
     flash("Transaksi tersimpan.", "success")
     return redirect(url_for("history"))
@@ -837,7 +1834,7 @@ def account_transfer():
     amount_s = (request.form.get("amount") or "").strip()
     note     = (request.form.get("note") or "").strip()
     admin_fee_s = (request.form.get("admin_fee") or "").strip()
-    month_param = (request.form.get("month") or "").strip() or date.today().strftime("%Y-%m")
+    month_param = normalize_month((request.form.get("month") or "").strip())
     next_url = request.form.get("next") or url_for("add_form")
 
     if from_acc not in VALID_PAYMENTS or to_acc not in VALID_PAYMENTS or from_acc == to_acc:
@@ -845,7 +1842,7 @@ def account_transfer():
         return redirect(next_url)
 
     try:
-        amt = float(amount_s)
+        amt = to_money(amount_s)
         if amt <= 0:
             raise ValueError
     except Exception:
@@ -853,36 +1850,24 @@ def account_transfer():
         return redirect(next_url)
 
     # Parse biaya admin (untuk validasi saldo & pencatatan)
-    fee_val = 0.0
+    fee_val = 0
     if admin_fee_s:
         try:
-            fee_val = float(admin_fee_s)
-            if fee_val < 0:
-                fee_val = 0.0
+            fee_val = max(0, to_money(admin_fee_s))
         except Exception:
-            fee_val = 0.0
+            fee_val = 0
 
-    # Cek saldo sumber cukup untuk jumlah + biaya admin pada bulan terkait
-    try:
-        bals = account_balances_month(current_user.id, month_param)
-        src = next((b for b in bals if b.get('acc') == from_acc), None)
-        available = float(src.get('saldo') if src else 0)
-    except Exception:
-        available = 0.0
-    needed = amt + (fee_val or 0.0)
+    # Cek saldo sumber cukup untuk jumlah + biaya admin (acuan: TRANSFER_BALANCE_POLICY)
+    available = transfer_available(current_user.id, from_acc, month_param)
+    needed = amt + fee_val
     if available < needed:
         flash(f"Mutasi gagal: saldo {from_acc} tidak mencukupi (tersedia {money(available)}).", "danger")
         return redirect(next_url)
 
     with db() as con:
-        cur = con.execute(
-            """
-            INSERT INTO account_transfers(user_id,date,from_account,to_account,amount,note)
-            VALUES (?,?,?,?,?,?)
-            """,
-            (current_user.id, date.today().isoformat(), from_acc, to_acc, amt, note or None),
+        transfer_id = transfer_insert(
+            con, current_user.id, date.today().isoformat(), from_acc, to_acc, amt, note or None
         )
-        transfer_id = getattr(cur, 'lastrowid', None)
 
         # Optional: catat biaya admin sebagai expense agar muncul di History
         # fee_val sudah dihitung di atas
@@ -908,14 +1893,10 @@ def account_transfer():
                 desc = 'Biaya Admin Tarik Tunai'
             else:
                 desc = 'Biaya Admin Top Up Rekening' if to_acc == 'Transfer' else 'Biaya Admin Mutasi Akun'
-            tx_cur = con.execute(
-                """
-                INSERT INTO transactions(user_id,date,type,category_id,amount,source_or_payee,account,notes)
-                VALUES (?,?,?,?,?,?,?,?)
-                """,
-                (current_user.id, date.today().isoformat(), 'expense', cat_id, fee_val, desc, from_acc, (note or None))
+            fee_tx_id = trx_insert(
+                con, current_user.id, date.today().isoformat(), 'expense', cat_id, fee_val,
+                desc, from_acc, (note or None)
             )
-            fee_tx_id = getattr(tx_cur, 'lastrowid', None)
             if transfer_id and fee_tx_id:
                 con.execute(
                     "UPDATE account_transfers SET fee_transaction_id=? WHERE id=? AND user_id=?",
@@ -982,13 +1963,18 @@ def edit_submit(trx_id):
         return redirect(url_for("edit_form", trx_id=trx_id))
 
     try:
-        amt = float(amount)
+        amt = to_money(amount)
         if amt <= 0:
             raise ValueError
     except:
         flash("Nominal harus angka positif.")
         return redirect(url_for("edit_form", trx_id=trx_id))
 
+    err = text_limit_error(source_or_payee=keterangan, notes=notes)
+    if err:
+        flash(err)
+        return redirect(url_for("edit_form", trx_id=trx_id))
+
     with db() as con:
         # pastikan transaksi milik user
         tx = con.execute("SELECT * FROM transactions WHERE id=? AND user_id=?", (trx_id, current_user.id)).fetchone()
@@ -1004,11 +1990,11 @@ def edit_submit(trx_id):
             flash("Kategori tidak ditemukan.")
             return redirect(url_for("edit_form", trx_id=trx_id))
 
-        con.execute("""
-            UPDATE transactions
-               SET date=?, category_id=?, amount=?, source_or_payee=?, account=?, notes=?
-             WHERE id=? AND user_id=?
-        """, (date_, cat_id_int, amt, keterangan, payment, notes, trx_id, current_user.id))
+        trx_update(
+            con, current_user.id, trx_id,
+            date=date_, category_id=cat_id_int, amount=amt,
+            source_or_payee=keterangan, account=payment, notes=notes,
+        )
 
     flash("Perubahan disimpan.", "warning")
     return redirect(url_for("history"))
@@ -1017,8 +2003,8 @@ def edit_submit(trx_id):
 @login_required
 def delete_trx(trx_id):
     with db() as con:
-        cur = con.execute("DELETE FROM transactions WHERE id=? AND user_id=?", (trx_id, current_user.id))
-    if getattr(cur, "rowcount", 0):
+        deleted = trx_delete(con, current_user.id, trx_id)
+    if deleted:
         flash("Transaksi dihapus.", "danger")
     else:
         flash("Transaksi tidak ditemukan.", "warning")
@@ -1029,98 +2015,252 @@ def delete_trx(trx_id):
 # Riwayat
 # =============================================================================
 
+# Opsi sort riwayat (whitelist) -> kunci ORDER BY (ekspresi, arah). Kunci
+# terakhir selalu t.id supaya urutan total dan bisa dipakai sebagai cursor.
+# Semua kunci NOT NULL dan punya index (migrasi 9); cek: `flask db check-plans`.
+HISTORY_SORTS = {
+    "date_desc":        [("t.date", "DESC"), ("t.id", "DESC")],
+    "date_asc":         [("t.date", "ASC"), ("t.id", "ASC")],
+    "amount_desc":      [("t.amount", "DESC"), ("t.id", "DESC")],
+    "amount_asc":       [("t.amount", "ASC"), ("t.id", "ASC")],
+    "category_asc":     [("t.cat_sort", "ASC"), ("t.date", "DESC"), ("t.id", "DESC")],
+    "category_desc":    [("t.cat_sort", "DESC"), ("t.date", "DESC"), ("t.id", "DESC")],
+    "payment_asc":      [("t.account", "ASC"), ("t.date", "DESC"), ("t.id", "DESC")],
+    "payment_desc":     [("t.account", "DESC"), ("t.date", "DESC"), ("t.id", "DESC")],
+    # 'income' > 'expense', jadi type DESC = pemasukan dulu
+    "type_income_first":  [("t.type", "DESC"), ("t.date", "DESC"), ("t.id", "DESC")],
+    "type_expense_first": [("t.type", "ASC"), ("t.date", "DESC"), ("t.id", "DESC")],
+}
+HISTORY_PER_PAGE = 20
+
+def encode_cursor(sort: str, values) -> str:
+    raw = json.dumps({"s": sort, "k": list(values)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(token: str, sort: str) -> list:
+    """Nilai kunci dari cursor; ValueError bila rusak atau dibuat untuk sort lain."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        keys = data["k"]
+    except Exception:
+        raise ValueError("cursor tidak valid")
+    if data.get("s") != sort or not isinstance(keys, list) or len(keys) != len(HISTORY_SORTS[sort]):
+        raise ValueError("cursor tidak cocok dengan urutan")
+    return keys
+
+def _keyset_after(keys, values, reverse=False):
+    """Predikat WHERE untuk baris setelah `values` menurut `keys`, sebagai
+    daftar (sql, params) berurutan; gabungan hasilnya = urutan sort penuh.
+
+    Arah seragam -> satu row value, langsung jadi range index. Arah campuran
+    (mis. akun ASC, terbaru dulu) dipecah per kelompok arah:
+    [k0 = v0 AND (k1, k2) < (v1, v2)], lalu [k0 > v0] — tiap potongan tetap
+    range index; OR tunggal memaksa SQLite menyusuri index dari awal.
+    """
+    groups = []
+    for i, (_, d) in enumerate(keys):
+        desc = (d == "DESC") != reverse
+        if groups and groups[-1][0] == desc:
+            groups[-1][1].append(i)
+        else:
+            groups.append((desc, [i]))
+    ranges = []
+    for g_i in range(len(groups) - 1, -1, -1):
+        desc, idx = groups[g_i]
+        prefix = [i for _, ids in groups[:g_i] for i in ids]
+        terms = [f"{keys[i][0]} = ?" for i in prefix]
+        cols = ", ".join(keys[i][0] for i in idx)
+        marks = ", ".join("?" for _ in idx)
+        terms.append(f"({cols}) {'<' if desc else '>'} ({marks})" if len(idx) > 1
+                     else f"{cols} {'<' if desc else '>'} ?")
+        ranges.append((" AND ".join(terms), [values[i] for i in prefix + idx]))
+    return ranges
+
+# Di bawah jumlah hasil FTS ini (semua user), halaman riwayat digerakkan dari
+# rowid hasil pencarian; di atasnya lebih murah menyusuri index user dan
+# berhenti di LIMIT. Diukur dengan bench/seed.py, 2 user x 100k transaksi.
+SEARCH_SPARSE_MATCHES = 5000
+
+def _history_filters(con, user_id: int, q_type: str, q_cat: str, q: str | None,
+                     alias: str = "t.", sparse: bool | None = None):
+    """WHERE + params untuk filter riwayat (jenis, kategori, teks).
+
+    `sparse` memaksa rencana lewat rowid FTS (True) atau index user (False);
+    None = pilih dari jumlah hasil pencarian.
+    """
+    where, params = [f"{alias}user_id=?"], [user_id]
+    if q_type:
+        where.append(f"{alias}type=?"); params.append(q_type)
+    if q_cat:
+        where.append(f"{alias}category_id=?"); params.append(int(q_cat))
+    match = search_match_query(q)
+    if match:
+        where.append(f"{alias}id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)")
+        params.append(match)
+        if sparse is None:
+            sparse = con.execute(
+                "SELECT COUNT(*) FROM (SELECT 1 FROM transactions_fts WHERE transactions_fts MATCH ? LIMIT ?)",
+                (match, SEARCH_SPARSE_MATCHES)
+            ).fetchone()[0] < SEARCH_SPARSE_MATCHES
+        if sparse:
+            # unary plus mematikan index user_id -> SQLite mencari lewat rowid hasil FTS
+            where[0] = f"+{alias}user_id=?"
+            if q_type:
+                where[1] = f"+{alias}type=?"
+    return where, params
+
+def history_rows(con, user_id: int, sort: str, q_type: str, q_cat: str, token: str | None,
+                 backward: bool, limit: int, q: str | None = None):
+    """Generator baris riwayat (sqlite3.Row, plus kolom kunci _k0.._kN) setelah
+    `token` menurut sort, maksimal `limit` baris; urutan terbalik bila
+    `backward`. Baris dibaca langsung dari cursor SQLite tanpa ditampung.
+    ValueError (saat baris pertama diminta) bila cursor tidak valid.
+    """
+    keys = HISTORY_SORTS[sort]
+    where, params = _history_filters(con, user_id, q_type, q_cat, q)
+    # Kunci sort yang dipatok filter (type=?, cat_sort=?) bernilai sama di
+    # semua baris: buang dari ORDER BY/cursor supaya sisa kunci tetap cocok
+    # dengan urutan index (tanpa USE TEMP B-TREE).
+    pinned = set()
+    if q_type:
+        pinned.add("t.type")
+    if q_cat:
+        pinned.add("t.cat_sort")
+        where.append("t.cat_sort=COALESCE((SELECT name FROM categories WHERE id=?), '')")
+        params.append(int(q_cat))
+    live = [i for i, (e, _) in enumerate(keys) if e not in pinned]
+
+    ranges = [("1", [])]
+    if token:
+        values = decode_cursor(token, sort)
+        ranges = _keyset_after([keys[i] for i in live], [values[i] for i in live], reverse=backward)
+
+    order_sql = ", ".join(
+        f"{e} {('ASC' if d == 'DESC' else 'DESC') if backward else d}" for e, d in (keys[i] for i in live)
+    )
+    key_cols = ", ".join(f"{e} AS _k{i}" for i, (e, _) in enumerate(keys))
+    for pred, p in ranges:
+        if limit <= 0:
+            return
+        cur = con.execute(
+            f"""
+            SELECT
+                t.id, t.date, t.type, t.category_id, t.amount, t.source_or_payee, t.account, t.notes,
+                COALESCE(c.name, '-') AS category,
+                c.emoji AS category_emoji,
+                t.source_or_payee AS keterangan,
+                t.account AS payment_method,
+                {key_cols}
+            FROM transactions t
+            LEFT JOIN categories c ON c.id = t.category_id
+            WHERE {" AND ".join(where)} AND {pred}
+            ORDER BY {order_sql}
+            LIMIT ?
+            """,
+            (*params, *p, limit)
+        )
+        for row in cur:
+            limit -= 1
+            yield row
+
+def history_cursor(sort: str, row) -> str:
+    """Cursor yang menunjuk ke `row` hasil history_rows."""
+    return encode_cursor(sort, [row[f"_k{i}"] for i in range(len(HISTORY_SORTS[sort]))])
+
+def history_page(con, user_id: int, sort: str = "date_desc", q_type: str = "", q_cat: str = "",
+                 after: str | None = None, before: str | None = None,
+                 per: int = HISTORY_PER_PAGE, q: str | None = None) -> dict:
+    """Satu halaman riwayat dengan keyset pagination.
+
+    Biaya halaman ke-N sama dengan halaman pertama (tanpa OFFSET), dan cursor
+    tetap stabil walau ada transaksi baru masuk. `after`/`before` adalah
+    cursor dari hasil sebelumnya; ValueError bila cursor tidak valid. `q`
+    (teks bebas) dicari lewat transactions_fts dan digabung dengan filter lain.
+    Mengembalikan {"rows", "next", "prev"} (cursor atau None).
+    """
+    backward = bool(before) and not after
+    token = before if backward else after
+    rows = list(history_rows(con, user_id, sort, q_type, q_cat, token, backward, per + 1, q))
+
+    more = len(rows) > per
+    rows = rows[:per]
+    if backward:
+        if not rows:
+            # mundur melewati baris pertama -> halaman pertama
+            return history_page(con, user_id, sort, q_type, q_cat, per=per, q=q)
+        rows.reverse()
+    if not rows:
+        return {"rows": [], "next": None, "prev": None}
+    cursor = lambda r: history_cursor(sort, r)
+    items = [{k: r[k] for k in r.keys() if not k.startswith("_k")} for r in rows]
+    return {
+        "rows": items,
+        # maju: ada halaman berikut bila baris lebih dari `per`; mundur: selalu ada
+        "next": cursor(rows[-1]) if (more or backward) else None,
+        "prev": cursor(rows[0]) if (token and not backward) or (backward and more) else None,
+    }
+
+def history_count(con, user_id: int, data_version: int, q_type: str = "", q_cat: str = "",
+                  q: str | None = None) -> int:
+    """Jumlah transaksi untuk filter riwayat; di-cache per data_version."""
+    match = search_match_query(q) or ""
+    n = history_count_cache.get(user_id, data_version, q_type, q_cat, match)
+    if n is None:
+        # COUNT tidak bisa berhenti di LIMIT -> selalu lewat rowid hasil FTS
+        where, params = _history_filters(con, user_id, q_type, q_cat, q, alias="", sparse=True)
+        n = con.execute(
+            f"SELECT COUNT(*) AS n FROM transactions WHERE {' AND '.join(where)}", params
+        ).fetchone()["n"]
+        history_count_cache.put(user_id, data_version, q_type, q_cat, match, value=n)
+    return n
+
 @app.get("/history")
 @login_required
 def history():
     q_type = (request.args.get("type") or "").strip()
     q_cat  = (request.args.get("category_id") or "").strip()
+    q_text = (request.args.get("q") or "").strip()[:100]
     # --- SORTING ---
     # ambil raw tanpa default; biarkan kosong jika tidak ada
     q_sort_raw = (request.args.get("sort") or "").strip()
 
-    order_map = {
-        "date_desc":        "t.date DESC, t.id DESC",
-        "date_asc":         "t.date ASC, t.id ASC",
-        "amount_desc":      "t.amount DESC, t.id DESC",
-        "amount_asc":       "t.amount ASC, t.id ASC",
-        "category_asc":     "c.name ASC, t.date DESC, t.id DESC",
-        "category_desc":    "c.name DESC, t.date DESC, t.id DESC",
-        "payment_asc":      "t.account ASC, t.date DESC, t.id DESC",
-        "payment_desc":     "t.account DESC, t.date DESC, t.id DESC",
-        "type_income_first":  "CASE WHEN t.type='income' THEN 0 ELSE 1 END, t.date DESC, t.id DESC",
-        "type_expense_first": "CASE WHEN t.type='expense' THEN 0 ELSE 1 END, t.date DESC, t.id DESC",
-    }
-
     # q_sort untuk template: validasi whitelist; kalau invalid/kosong -> ""
-    q_sort = q_sort_raw if q_sort_raw in order_map else ""
-
-    # ORDER BY untuk query: kalau q_sort kosong -> pakai default date_desc
-    order_sql = order_map.get(q_sort or "date_desc")
+    q_sort = q_sort_raw if q_sort_raw in HISTORY_SORTS else ""
 
     if q_type not in ("income", "expense"):
         q_type = ""
     if q_cat and not str(q_cat).isdigit():
         q_cat = ""
 
-    # paging
-    per = 20
-    try:
-        page = int(request.args.get("page", "1"))
-    except ValueError:
-        page = 1
-    page = max(1, page)
-
-    where = ["t.user_id=?"]
-    params = [current_user.id]
-    if q_type:
-        where.append("t.type=?"); params.append(q_type)
-    if q_cat:
-        where.append("t.category_id=?"); params.append(int(q_cat))
-    where_clause = " AND ".join(where)
-
-    with db() as con:
-        total = con.execute(
-            f"SELECT COUNT(*) AS n FROM transactions t WHERE {where_clause}",
-            params
-        ).fetchone()["n"]
-
-    pages = max(1, (total + per - 1) // per)
-    if page > pages:
-        page = pages
-    offset = (page - 1) * per
+    # paging: cursor ?after=/?before= (keyset, tanpa OFFSET)
+    after = request.args.get("after") or None
+    before = request.args.get("before") or None
 
     with db() as con:
         cats = con.execute(
             "SELECT id, type, name FROM categories WHERE user_id=? ORDER BY type, name",
-            (current_user.id,)
-        ).fetchall()
-
-        rows = con.execute(
-            f"""
-            SELECT
-                t.*,
-                COALESCE(c.name, '-') AS category,
-                c.emoji AS category_emoji,
-                t.source_or_payee AS keterangan,
-                t.account AS payment_method
-            FROM transactions t
-            LEFT JOIN categories c ON c.id = t.category_id
-            WHERE {where_clause}
-            ORDER BY {order_sql}
-            LIMIT ? OFFSET ?
-            """,
-            (*params, per, offset)
+            (current_user.id,)
         ).fetchall()
 
+        try:
+            page = history_page(con, current_user.id, q_sort or "date_desc", q_type, q_cat,
+                                after, before, q=q_text)
+        except ValueError:
+            # cursor lama/rusak (mis. sort diganti) -> kembali ke halaman pertama
+            page = history_page(con, current_user.id, q_sort or "date_desc", q_type, q_cat, q=q_text)
+        total = history_count(con, current_user.id, current_user.data_version, q_type, q_cat, q_text)
+
     return render_template(
         "history.html",
-        rows=[dict(r) for r in rows],
+        rows=page["rows"],
         categories=[dict(c) for c in cats],
         q_type=q_type,
         q_cat=q_cat,
         q_sort=q_sort, 
-        page=page,
-        pages=pages,
+        q_text=q_text,
+        next_cursor=page["next"],
+        prev_cursor=page["prev"],
+        total=total,
         title="Riwayat",
     )
 
@@ -1157,6 +2297,10 @@ def categories_add():
     if not name or type_ not in ("income", "expense"):
         flash("Isi nama kategori dengan benar.")
         return redirect(url_for("categories_page"))
+    err = text_limit_error(category=name)
+    if err:
+        flash(err)
+        return redirect(url_for("categories_page"))
     with db() as con:
         try:
             con.execute("INSERT INTO categories(user_id,type,name,emoji) VALUES (?,?,?,?)", (current_user.id, type_, name, emoji or None))
@@ -1174,6 +2318,10 @@ def categories_edit(cat_id):
     if not name:
         flash("Nama kategori tidak boleh kosong.")
         return redirect(url_for("categories_page"))
+    err = text_limit_error(category=name)
+    if err:
+        flash(err)
+        return redirect(url_for("categories_page"))
     with db() as con:
         row = con.execute("SELECT * FROM categories WHERE id=? AND user_id=?", (cat_id, current_user.id)).fetchone()
         if not row:
@@ -1227,7 +2375,7 @@ def budgets_page():
 def budgets_set():
     month = request.form.get("month")
     category_id = int(request.form.get("category_id"))
-    amount = float(request.form.get("amount"))
+    amount = to_money(request.form.get("amount"))
     action = (request.form.get("action") or "").strip().lower()
     with db() as con:
         con.execute("""
@@ -1235,6 +2383,7 @@ def budgets_set():
             VALUES (?,?,?,?)
             ON CONFLICT(user_id,category_id,month) DO UPDATE SET amount=excluded.amount
         """, (current_user.id, category_id, month, amount))
+        con.execute("DELETE FROM budget_outcomes WHERE user_id=? AND month=?", (current_user.id, month))
     flash("Budget disimpan.", "warning" if action == "edit" else "success")
     return redirect(url_for("budgets_page", month=month))
 
@@ -1245,6 +2394,13 @@ def budgets_delete(budget_id: int):
     # bulan untuk redirect; fallback ke bulan berjalan jika tidak dikirim
     month = request.form.get("month") or date.today().strftime("%Y-%m")
     with db() as con:
+        con.execute(
+            """
+            DELETE FROM budget_outcomes
+            WHERE user_id=? AND month=(SELECT month FROM budgets WHERE id=? AND user_id=?)
+            """,
+            (current_user.id, budget_id, current_user.id)
+        )
         con.execute("DELETE FROM budgets WHERE id=? AND user_id=?", (budget_id, current_user.id))
     flash("Budget dihapus.", "danger")
     return redirect(url_for("budgets_page", month=month))
@@ -1254,106 +2410,234 @@ def budgets_delete(budget_id: int):
 # Savings (Tab Tabungan)
 # =============================================================================
 
-def ensure_autosavings_up_to_prev_month(user_id: int):
-    today = date.today()
-    prev_month = (today.replace(day=1) - relativedelta(days=1)).strftime("%Y-%m")
+# Ringkasan tabungan per user (savings_ledger) dan per goal (savings_goals.allocated).
+# Semua perubahan auto-transfer, top-up, alokasi, dan konsumsi lewat helper di
+# bawah supaya ringkasan ikut berubah di transaksi DB yang sama.
+
+SAVINGS_LEDGER_FIELDS = ("total_in", "total_manual", "total_allocated", "total_consumed")
+
+def _savings_adjust(con, user_id: int, **deltas):
+    """Tambahkan delta ke kolom savings_ledger (nama kolom = SAVINGS_LEDGER_FIELDS)."""
+    vals = [int(deltas.get(f, 0)) for f in SAVINGS_LEDGER_FIELDS]
+    if not any(vals):
+        return
+    con.execute(
+        f"""
+        INSERT INTO savings_ledger(user_id, {", ".join(SAVINGS_LEDGER_FIELDS)}) VALUES (?,?,?,?,?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            {", ".join(f"{f} = {f} + excluded.{f}" for f in SAVINGS_LEDGER_FIELDS)}
+        """,
+        (user_id, *vals)
+    )
 
-    with db() as con:
-        row = con.execute(
-            "SELECT MIN(substr(date,1,7)) AS m FROM transactions WHERE user_id=?",
-            (user_id,)
-        ).fetchone()
-        first_trx_month = row["m"] if row else None
-        if not first_trx_month:
-            return
+def savings_summary(con, user_id: int) -> dict:
+    """Angka ringkasan tabungan (O(1)) + pot_available = masuk - alokasi - konsumsi."""
+    row = con.execute(
+        f"SELECT {', '.join(SAVINGS_LEDGER_FIELDS)} FROM savings_ledger WHERE user_id=?", (user_id,)
+    ).fetchone()
+    out = {f: int(row[f]) if row else 0 for f in SAVINGS_LEDGER_FIELDS}
+    out["pot_available"] = out["total_in"] - out["total_allocated"] - out["total_consumed"]
+    return out
+
+def savings_allocation_insert(con, user_id: int, goal_id: int, amount: int, date_: str, note=None):
+    """Catat alokasi (+) atau pelepasan (-) dana ke goal."""
+    con.execute(
+        "INSERT INTO savings_allocations(user_id,goal_id,amount,date,note) VALUES (?,?,?,?,?)",
+        (user_id, goal_id, amount, date_, note)
+    )
+    con.execute("UPDATE savings_goals SET allocated = allocated + ? WHERE id=? AND user_id=?",
+                (amount, goal_id, user_id))
+    _savings_adjust(con, user_id, total_allocated=amount)
+    savings_mark_achieved(con, user_id, goal_id)
+
+def savings_topup_add(con, user_id: int, month: str, date_: str, amount: int, note=None,
+                      transaction_id=None) -> int:
+    cur = con.execute(
+        "INSERT INTO savings_manual_topups(user_id,month,date,amount,note,transaction_id) VALUES (?,?,?,?,?,?)",
+        (user_id, month, date_, amount, note, transaction_id)
+    )
+    _savings_adjust(con, user_id, total_in=amount, total_manual=amount)
+    return cur.lastrowid
+
+def savings_topup_remove(con, user_id: int, topup_id: int) -> bool:
+    row = con.execute(
+        "SELECT amount FROM savings_manual_topups WHERE id=? AND user_id=?", (topup_id, user_id)
+    ).fetchone()
+    if not row:
+        return False
+    con.execute("DELETE FROM savings_manual_topups WHERE id=? AND user_id=?", (topup_id, user_id))
+    _savings_adjust(con, user_id, total_in=-row["amount"], total_manual=-row["amount"])
+    return True
+
+def savings_goal_remove(con, user_id: int, goal_id: int, consume: bool, note=None):
+    """Hapus goal beserta alokasinya; consume=True -> alokasi dicatat terpakai permanen."""
+    row = con.execute(
+        "SELECT allocated FROM savings_goals WHERE id=? AND user_id=?", (goal_id, user_id)
+    ).fetchone()
+    if not row:
+        return
+    allocated = int(row["allocated"])
+    consumed = allocated if consume and allocated > 0 else 0
+    if consumed:
+        con.execute("INSERT INTO savings_consumed(user_id,amount,note) VALUES (?,?,?)",
+                    (user_id, consumed, note))
+    con.execute("DELETE FROM savings_allocations WHERE user_id=? AND goal_id=?", (user_id, goal_id))
+    con.execute("DELETE FROM savings_goals WHERE id=? AND user_id=?", (goal_id, user_id))
+    _savings_adjust(con, user_id, total_allocated=-allocated, total_consumed=consumed)
+
+def savings_ledger_from_source(con, user_id: int | None = None) -> dict:
+    """{user_id: {kolom ledger: nilai}} dihitung ulang dari tabel tabungan."""
+    where, params = ("WHERE user_id=?", (user_id,)) if user_id is not None else ("", ())
+    out = {}
+    for field, sql in (
+        ("auto", "SELECT user_id, SUM(amount) AS s FROM savings_auto_transfers {w} GROUP BY user_id"),
+        ("total_manual", "SELECT user_id, SUM(amount) AS s FROM savings_manual_topups {w} GROUP BY user_id"),
+        ("total_allocated", "SELECT user_id, SUM(amount) AS s FROM savings_allocations {w} GROUP BY user_id"),
+        ("total_consumed", "SELECT user_id, SUM(amount) AS s FROM savings_consumed {w} GROUP BY user_id"),
+    ):
+        for r in con.execute(sql.format(w=where), params):
+            out.setdefault(r["user_id"], {}).update({field: int(r["s"] or 0)})
+    ledger = {}
+    for uid, v in out.items():
+        ledger[uid] = {
+            "total_in": v.get("auto", 0) + v.get("total_manual", 0),
+            "total_manual": v.get("total_manual", 0),
+            "total_allocated": v.get("total_allocated", 0),
+            "total_consumed": v.get("total_consumed", 0),
+        }
+    return ledger
+
+def verify_savings_ledger(con, user_id: int | None = None, fix: bool = False) -> list[dict]:
+    """Bandingkan savings_ledger dan savings_goals.allocated dengan hitung ulang.
+
+    Satu dict per selisih ({"user_id", "field", "stored", "expected"}, plus
+    "goal_id" untuk selisih per goal); fix=True menimpa nilai tersimpan.
+    """
+    where, params = ("WHERE user_id=?", (user_id,)) if user_id is not None else ("", ())
+    stored = {
+        r["user_id"]: {f: int(r[f]) for f in SAVINGS_LEDGER_FIELDS}
+        for r in con.execute(f"SELECT * FROM savings_ledger {where}", params)
+    }
+    expected = savings_ledger_from_source(con, user_id)
+    zero = dict.fromkeys(SAVINGS_LEDGER_FIELDS, 0)
+    drift = []
+    for uid in sorted(set(stored) | set(expected)):
+        have, want = stored.get(uid, zero), expected.get(uid, zero)
+        for f in SAVINGS_LEDGER_FIELDS:
+            if have[f] != want[f]:
+                drift.append({"user_id": uid, "field": f, "stored": have[f], "expected": want[f]})
+    goals = con.execute(
+        f"""
+        SELECT g.id, g.user_id, g.allocated,
+               (SELECT COALESCE(SUM(a.amount),0) FROM savings_allocations a
+                WHERE a.user_id=g.user_id AND a.goal_id=g.id) AS expected
+        FROM savings_goals g {where.replace("user_id", "g.user_id")}
+        """,
+        params
+    ).fetchall()
+    goal_drift = [
+        {"user_id": g["user_id"], "goal_id": g["id"], "field": "allocated",
+         "stored": int(g["allocated"]), "expected": int(g["expected"])}
+        for g in goals if int(g["allocated"]) != int(g["expected"])
+    ]
+    if fix:
+        fix_users = {d["user_id"] for d in drift}
+        con.executemany(
+            f"""
+            INSERT INTO savings_ledger(user_id, {", ".join(SAVINGS_LEDGER_FIELDS)}) VALUES (?,?,?,?,?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                {", ".join(f"{f} = excluded.{f}" for f in SAVINGS_LEDGER_FIELDS)}
+            """,
+            [(uid, *(expected.get(uid, zero)[f] for f in SAVINGS_LEDGER_FIELDS)) for uid in sorted(fix_users)]
+        )
+        con.executemany("UPDATE savings_goals SET allocated=? WHERE id=?",
+                        [(d["expected"], d["goal_id"]) for d in goal_drift])
+    return drift + goal_drift
 
-        ym = datetime.strptime(first_trx_month + "-01", "%Y-%m-%d").date()
-        stop = datetime.strptime(prev_month + "-01", "%Y-%m-%d").date()
+def autosave_sync(con, user_id: int, through: str) -> bool:
+    """Sinkronkan savings_auto_transfers (sisa income > 0 per bulan) s.d. `through`.
 
-        while ym <= stop:
-            ym_str = ym.strftime("%Y-%m")
-            totals = con.execute(
-                """
-                SELECT
-                  SUM(CASE WHEN type='income'  THEN amount ELSE 0 END) AS inc,
-                  SUM(CASE WHEN type='expense' THEN amount ELSE 0 END) AS exp
-                FROM transactions
-                WHERE user_id=? AND substr(date,1,7)=?
-                """,
-                (user_id, ym_str)
-            ).fetchone()
+    Hanya bulan sesudah watermark users.autosave_through dan bulan lama yang
+    ditandai kotor oleh write layer yang dihitung ulang, dalam satu query
+    GROUP BY. Bila tidak ada yang berubah, fungsi ini tidak menulis apa pun
+    (return False).
+    """
+    row = con.execute(
+        """
+        SELECT autosave_through AS wm,
+               EXISTS(SELECT 1 FROM savings_dirty_months WHERE user_id=? AND month<=?) AS dirty
+        FROM users WHERE id=?
+        """,
+        (user_id, through, user_id)
+    ).fetchone()
+    if row is None or ((row["wm"] or "") >= through and not row["dirty"]):
+        return False
 
-            inc = float(totals["inc"] or 0)
-            exp = float(totals["exp"] or 0)
-            net = inc - exp
+    # bulan yang dihitung ulang: (watermark, through] + bulan kotor <= through
+    months = """
+        ((month > ? AND month <= ?)
+         OR month IN (SELECT month FROM savings_dirty_months WHERE user_id=? AND month <= ?))
+    """
+    mp = (row["wm"] or "", through, user_id, through)
+    auto_sum = f"SELECT COALESCE(SUM(amount),0) AS t FROM savings_auto_transfers WHERE user_id=? AND {months}"
+    before = con.execute(auto_sum, (user_id, *mp)).fetchone()["t"]
+    con.execute(f"DELETE FROM savings_auto_transfers WHERE user_id=? AND {months}", (user_id, *mp))
+    con.execute(
+        f"""
+        INSERT INTO savings_auto_transfers(user_id, month, amount)
+        SELECT user_id, month, SUM(CASE WHEN type='income' THEN total ELSE -total END) AS net
+        FROM monthly_rollups
+        WHERE user_id=? AND {months}
+        GROUP BY month
+        HAVING net > 0
+        """,
+        (user_id, *mp)
+    )
+    _savings_adjust(con, user_id, total_in=con.execute(auto_sum, (user_id, *mp)).fetchone()["t"] - before)
+    con.execute("DELETE FROM savings_dirty_months WHERE user_id=? AND month<=?", (user_id, through))
+    con.execute("UPDATE users SET autosave_through=MAX(COALESCE(autosave_through,''), ?) WHERE id=?",
+                (through, user_id))
+    return True
+
+def ensure_autosavings_up_to_prev_month(user_id: int):
+    """Autosave s.d. bulan lalu; biasanya no-op karena `flask finance close-month` sudah jalan."""
+    prev_month = (date.today().replace(day=1) - relativedelta(days=1)).strftime("%Y-%m")
+    with db() as con:
+        autosave_sync(con, user_id, prev_month)
 
-            if net > 0:
-                con.execute(
-                    """
-                    INSERT INTO savings_auto_transfers(user_id, month, amount)
-                    VALUES (?,?,?)
-                    ON CONFLICT(user_id, month) DO UPDATE SET amount=excluded.amount
-                    """,
-                    (user_id, ym_str, net)
-                )
-            else:
-                con.execute(
-                    "DELETE FROM savings_auto_transfers WHERE user_id=? AND month=?",
-                    (user_id, ym_str)
-                )
 
-            ym = (ym.replace(day=1) + relativedelta(months=1))
+def savings_mark_achieved(con, user_id: int, goal_id: int):
+    """Set achieved_at sekali, saat total alokasi goal pertama kali mencapai target.
 
+    Dipanggil dari jalur yang mengubah alokasi (allocate/release), bukan saat
+    halaman dibaca.
+    """
+    con.execute(
+        """
+        UPDATE savings_goals SET achieved_at=?
+        WHERE id=? AND user_id=? AND achieved_at IS NULL AND allocated >= target_amount
+        """,
+        (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), goal_id, user_id)
+    )
 
 @app.get("/savings")
 @login_required
 def savings_page():
     ensure_autosavings_up_to_prev_month(current_user.id)
     with db() as con:
-        total_auto = con.execute(
-            "SELECT COALESCE(SUM(amount),0) AS t FROM savings_auto_transfers WHERE user_id=?",
-            (current_user.id,)
-        ).fetchone()["t"]
-        total_manual = con.execute(
-            "SELECT COALESCE(SUM(amount),0) AS t FROM savings_manual_topups WHERE user_id=?",
-            (current_user.id,)
-        ).fetchone()["t"]
+        # total masuk (auto + manual), alokasi, konsumsi permanen -> savings_ledger
+        summary = savings_summary(con, current_user.id)
 
         rows = con.execute(
             """
-            SELECT g.id, g.name, g.target_amount, g.created_at, g.achieved_at, g.archived_at,
-                   COALESCE(SUM(a.amount),0) AS allocated
-            FROM savings_goals g
-            LEFT JOIN savings_allocations a ON a.goal_id=g.id AND a.user_id=g.user_id
-            WHERE g.user_id=?
-            GROUP BY g.id
-            ORDER BY g.created_at DESC
+            SELECT id, name, target_amount, created_at, achieved_at, archived_at, allocated
+            FROM savings_goals
+            WHERE user_id=?
+            ORDER BY created_at DESC
             """,
             (current_user.id,)
         ).fetchall()
-
         goals = [dict(r) for r in rows]
-        total_alloc = sum(float(r["allocated"]) for r in goals)
-        # konsumsi permanen (goal yang dihapus, dsb.)
-        total_consumed = con.execute(
-            "SELECT COALESCE(SUM(amount),0) AS t FROM savings_consumed WHERE user_id=?",
-            (current_user.id,)
-        ).fetchone()["t"]
-
-        # total masuk tabungan = auto + manual
-        total_in = float(total_auto) + float(total_manual)
-        # saldo tersedia = total in - (alokasi aktif/arsip + konsumsi permanen)
-        pot_available = total_in - (float(total_alloc) + float(total_consumed))
-
-        # Tandai achieved_at bila terpenuhi namun belum ditandai
-        achieved_ids = [g["id"] for g in goals if not g.get("achieved_at") and float(g["allocated"]) >= float(g["target_amount"]) ]
-        if achieved_ids:
-            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            for gid in achieved_ids:
-                con.execute(
-                    "UPDATE savings_goals SET achieved_at=? WHERE id=? AND user_id=?",
-                    (now, gid, current_user.id)
-                )
 
         autosave_history = con.execute(
             "SELECT month, amount FROM savings_auto_transfers WHERE user_id=? ORDER BY month DESC LIMIT 12",
@@ -1362,19 +2646,8 @@ def savings_page():
 
         # Sisa income bulan berjalan yang tersedia (income - expense)
         curr_month = date.today().strftime("%Y-%m")
-        month_totals = con.execute(
-            """
-            SELECT
-              SUM(CASE WHEN type='income' THEN amount ELSE 0 END) AS inc,
-              SUM(CASE WHEN type='expense' THEN amount ELSE 0 END) AS exp
-            FROM transactions
-            WHERE user_id=? AND substr(date,1,7)=?
-            """,
-            (current_user.id, curr_month)
-        ).fetchone()
-        inc_m = float(month_totals["inc"] or 0)
-        exp_m = float(month_totals["exp"] or 0)
-        avail_current = max(0.0, inc_m - exp_m)
+        inc_m, exp_m = month_totals(con, current_user.id, curr_month)
+        avail_current = max(0, inc_m - exp_m)
 
         # Daftar top-up manual bulan berjalan
         topups_current = con.execute(
@@ -1386,19 +2659,19 @@ def savings_page():
     active_goals = []
     archived_goals = []
     for g in goals:
-        g["remaining"] = max(0.0, float(g["target_amount"]) - float(g["allocated"]))
+        g["remaining"] = max(0, g["target_amount"] - g["allocated"])
         if g.get("archived_at"):
             archived_goals.append(g)
         else:
             active_goals.append(g)
 
-    any_achieved_active = any((float(g["allocated"]) >= float(g["target_amount"])) and (not g.get("archived_at")) for g in goals)
+    any_achieved_active = any((g["allocated"] >= g["target_amount"]) and (not g.get("archived_at")) for g in goals)
     return render_template(
         "savings.html",
-        pot_available=pot_available,
-        total_auto=total_in,
-        total_manual=total_manual,
-        total_alloc=(float(total_alloc) + float(total_consumed)),
+        pot_available=summary["pot_available"],
+        total_auto=summary["total_in"],
+        total_manual=summary["total_manual"],
+        total_alloc=(summary["total_allocated"] + summary["total_consumed"]),
         active_goals=active_goals,
         archived_goals=archived_goals,
         any_achieved=any_achieved_active,
@@ -1416,7 +2689,7 @@ def savings_topup():
     amount = request.form.get("amount")
     note = (request.form.get("note") or "").strip()
     try:
-        amt = float(amount)
+        amt = to_money(amount)
         if amt <= 0:
             raise ValueError
     except Exception:
@@ -1427,19 +2700,9 @@ def savings_topup():
     month = today.strftime("%Y-%m")
     with db() as con:
         # Hitung sisa income bulan berjalan dan tolak jika melebihi
-        month_totals = con.execute(
-            """
-            SELECT
-              SUM(CASE WHEN type='income' THEN amount ELSE 0 END) AS inc,
-              SUM(CASE WHEN type='expense' THEN amount ELSE 0 END) AS exp
-            FROM transactions
-            WHERE user_id=? AND substr(date,1,7)=?
-            """,
-            (current_user.id, month)
-        ).fetchone()
-        inc_m = float(month_totals["inc"] or 0); exp_m = float(month_totals["exp"] or 0)
-        avail_current = max(0.0, inc_m - exp_m)
-        if amt > avail_current + 1e-6:
+        inc_m, exp_m = month_totals(con, current_user.id, month)
+        avail_current = max(0, inc_m - exp_m)
+        if amt > avail_current:
             flash(f"Nominal melebihi sisa income bulan ini: {money(avail_current)}")
             return redirect(url_for("savings_page"))
 
@@ -1454,19 +2717,12 @@ def savings_topup():
         ).fetchone()["id"]
 
         # Catat transaksi expense yang mengurangi income bulan ini
-        cur_tx = con.execute(
-            """
-            INSERT INTO transactions(user_id,date,type,category_id,amount,source_or_payee,account,notes)
-            VALUES (?,?,?,?,?,?,?,?)
-            """,
-            (current_user.id, today.isoformat(), 'expense', cat_id, amt, 'Top-up Tabungan', 'Transfer', note or None)
+        tx_id = trx_insert(
+            con, current_user.id, today.isoformat(), 'expense', cat_id, amt,
+            'Top-up Tabungan', 'Transfer', note or None
         )
-        tx_id = cur_tx.lastrowid
 
-        con.execute(
-            "INSERT INTO savings_manual_topups(user_id,month,date,amount,note,transaction_id) VALUES (?,?,?,?,?,?)",
-            (current_user.id, month, today.isoformat(), amt, note or None, tx_id)
-        )
+        savings_topup_add(con, current_user.id, month, today.isoformat(), amt, note or None, tx_id)
     flash("Top up tabungan bulan ini disimpan.", "success")
     return redirect(url_for("savings_page"))
 
@@ -1490,8 +2746,8 @@ def savings_topup_delete(topup_id):
 
         tx_id = row["transaction_id"]
         if tx_id:
-            con.execute("DELETE FROM transactions WHERE id=? AND user_id=?", (tx_id, current_user.id))
-        con.execute("DELETE FROM savings_manual_topups WHERE id=? AND user_id=?", (topup_id, current_user.id))
+            trx_delete(con, current_user.id, tx_id)
+        savings_topup_remove(con, current_user.id, topup_id)
 
     flash("Top-up bulan ini dibatalkan dan dana dikembalikan ke sisa income bulan ini.", "danger")
     return redirect(url_for("savings_page"))
@@ -1503,7 +2759,7 @@ def savings_create_goal():
     name = (request.form.get("name") or "").strip()
     target = (request.form.get("target_amount") or "").strip()
     try:
-        target_val = float(target)
+        target_val = to_money(target)
         if target_val <= 0:
             raise ValueError
     except Exception:
@@ -1531,7 +2787,7 @@ def savings_allocate():
 
     try:
         gid = int(goal_id)
-        amt = float(amount)
+        amt = to_money(amount)
         if amt <= 0:
             raise ValueError
     except Exception:
@@ -1539,23 +2795,12 @@ def savings_allocate():
         return redirect(url_for("savings_page"))
 
     with db() as con:
-        total_auto = con.execute(
-            "SELECT COALESCE(SUM(amount),0) AS t FROM savings_auto_transfers WHERE user_id=?",
-            (current_user.id,)
-        ).fetchone()["t"]
-        total_alloc = con.execute(
-            "SELECT COALESCE(SUM(amount),0) AS t FROM savings_allocations WHERE user_id=?",
-            (current_user.id,)
-        ).fetchone()["t"]
-        pot_available = float(total_auto) - float(total_alloc)
+        # saldo tersedia sama persis dengan yang ditampilkan di /savings
+        pot_available = savings_summary(con, current_user.id)["pot_available"]
 
         row = con.execute(
-            """
-            SELECT target_amount, archived_at,
-                   COALESCE((SELECT SUM(amount) FROM savings_allocations WHERE user_id=? AND goal_id=?),0) AS allocated
-            FROM savings_goals WHERE id=? AND user_id=?
-            """,
-            (current_user.id, gid, gid, current_user.id)
+            "SELECT target_amount, archived_at, allocated FROM savings_goals WHERE id=? AND user_id=?",
+            (gid, current_user.id)
         ).fetchone()
         if not row:
             flash("Goal tidak ditemukan.")
@@ -1564,17 +2809,13 @@ def savings_allocate():
             flash("Goal sudah diarsipkan, tidak bisa dialokasikan.")
             return redirect(url_for("savings_page"))
 
-        remaining = max(0.0, float(row["target_amount"]) - float(row["allocated"]))
+        remaining = max(0, row["target_amount"] - row["allocated"])
         allowed = min(pot_available, remaining)
-        if amt > allowed + 1e-6:
-            flash(f"Maksimal alokasi yang diperbolehkan: Rp {allowed:,.0f}".replace(',', '.'))
+        if amt > allowed:
+            flash(f"Maksimal alokasi yang diperbolehkan: {money(allowed)}")
             return redirect(url_for("savings_page"))
 
-        today_iso = date.today().isoformat()
-        con.execute(
-            "INSERT INTO savings_allocations(user_id,goal_id,amount,date,note) VALUES (?,?,?,?,?)",
-            (current_user.id, gid, amt, today_iso, note or None)
-        )
+        savings_allocation_insert(con, current_user.id, gid, amt, date.today().isoformat(), note or None)
 
     flash("Alokasi tersimpan.", "success")
     return redirect(url_for("savings_page"))
@@ -1616,7 +2857,7 @@ def savings_release():
 
     try:
         gid = int(goal_id)
-        amt = float(amount)
+        amt = to_money(amount)
         if amt <= 0:
             raise ValueError
     except Exception:
@@ -1624,24 +2865,17 @@ def savings_release():
         return redirect(url_for("savings_page"))
 
     with db() as con:
-        ok = con.execute("SELECT 1 FROM savings_goals WHERE id=? AND user_id=?", (gid, current_user.id)).fetchone()
-        if not ok:
-            flash("Goal tidak ditemukan.")
-            return redirect(url_for("savings_page"))
         row = con.execute(
-            "SELECT COALESCE((SELECT SUM(amount) FROM savings_allocations WHERE user_id=? AND goal_id=?),0) AS allocated",
-            (current_user.id, gid)
+            "SELECT allocated FROM savings_goals WHERE id=? AND user_id=?", (gid, current_user.id)
         ).fetchone()
-        allocated = float(row["allocated"]) if row else 0.0
-        if amt > allocated + 1e-6:
+        if not row:
+            flash("Goal tidak ditemukan.")
+            return redirect(url_for("savings_page"))
+        if amt > row["allocated"]:
             flash("Tidak bisa melepas dana melebihi yang sudah dialokasikan.")
             return redirect(url_for("savings_page"))
 
-        today_iso = date.today().isoformat()
-        con.execute(
-            "INSERT INTO savings_allocations(user_id,goal_id,amount,date,note) VALUES (?,?,?,?,?)",
-            (current_user.id, gid, -amt, today_iso, note or "Release dana")
-        )
+        savings_allocation_insert(con, current_user.id, gid, -amt, date.today().isoformat(), note or "Release dana")
 
     flash("Dana dilepas kembali ke saldo tabungan.", "warning")
     return redirect(url_for("savings_page"))
@@ -1659,21 +2893,8 @@ def savings_goal_delete(goal_id):
             flash("Goal tidak ditemukan.")
             return redirect(url_for("savings_page"))
 
-        # Hitung total alokasi pada goal ini
-        row = con.execute(
-            "SELECT COALESCE(SUM(amount),0) AS t FROM savings_allocations WHERE user_id=? AND goal_id=?",
-            (current_user.id, goal_id)
-        ).fetchone()
-        total_alloc = float(row["t"] or 0)
-
         if g["archived_at"]:
             # Perilaku lama: alokasi dianggap terpakai permanen
-            if total_alloc > 0:
-                note = f"Hapus goal: {g['name']}"
-                con.execute(
-                    "INSERT INTO savings_consumed(user_id,amount,note) VALUES (?,?,?)",
-                    (current_user.id, total_alloc, note)
-                )
             flash_msg = "Goal dihapus. Dana yang telah dialokasikan dianggap terpakai."
         else:
             # Goal aktif: hapus goal dan semua alokasi tanpa mencatat konsumsi
@@ -1681,8 +2902,8 @@ def savings_goal_delete(goal_id):
             flash_msg = "Goal aktif dihapus. Dana alokasi dikembalikan ke saldo tabungan."
 
         # Hapus alokasi dan goal
-        con.execute("DELETE FROM savings_allocations WHERE user_id=? AND goal_id=?", (current_user.id, goal_id))
-        con.execute("DELETE FROM savings_goals WHERE id=? AND user_id=?", (goal_id, current_user.id))
+        savings_goal_remove(con, current_user.id, goal_id, consume=bool(g["archived_at"]),
+                            note=f"Hapus goal: {g['name']}")
 
     flash(flash_msg, "danger")
     return redirect(url_for("savings_page"))
@@ -1758,7 +2979,7 @@ def export_pdf():
         c.drawRightString(w - margin_r, y0, f"Dicetak: {datetime.now():%d/%m/%Y %H:%M}")
 
         # Ringkasan angka
-        inc = float(totals['inc'] or 0); exp = float(totals['exp'] or 0); net = inc - exp
+        inc = int(totals['inc'] or 0); exp = int(totals['exp'] or 0); net = inc - exp
         y1 = y0 - 16
         c.setFont("Helvetica-Bold", 10); c.drawString(margin_l, y1, f"Pendapatan: {money(inc)}")
         y1 -= 14; c.setFont("Helvetica", 10); c.drawString(margin_l, y1, f"Pengeluaran: {money(exp)}")
@@ -1858,11 +3079,195 @@ COLUMN_ALIASES = {
     "payment_method": "account",
 }
 
+# Import dibaca per potongan supaya memori puncak tidak bergantung ukuran file
+IMPORT_CHUNK_ROWS = 5000
+
+# `row` = nomor baris data (1 = baris pertama setelah header, baris kosong
+# tidak dihitung), bukan nomor baris file: pembaca per potongan tidak tahu
+# baris kosong yang dilewati atau sel berisi beberapa baris.
+IMPORT_ERROR_COLUMNS = ["row", "field", "value", "message"]
+
+class ImportValidationError(ValueError):
+    """Isi file import tidak valid (pesan siap ditampilkan ke user)."""
+
+def iter_import_chunks(f, ext: str, chunk_rows: int = IMPORT_CHUNK_ROWS):
+    """Yield DataFrame mentah per potongan `chunk_rows` baris.
+
+    CSV lewat read_csv(chunksize), .xlsx lewat openpyxl read_only. File
+    tanpa baris data tetap menghasilkan satu frame kosong (untuk cek kolom).
+    """
+    if ext == ".csv":
+        yield from pd.read_csv(f, chunksize=chunk_rows)
+        return
+    if ext != ".xlsx":
+        yield pd.read_excel(f)      # .xls: format lama, tidak bisa di-stream
+        return
+    wb = load_workbook(f, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        cols = ["" if c is None else str(c) for c in header]
+        buf, sent = [], False
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            buf.append((tuple(row) + (None,) * len(cols))[:len(cols)])
+            if len(buf) == chunk_rows:
+                yield pd.DataFrame(buf, columns=cols)
+                buf, sent = [], True
+        if buf or not sent:
+            yield pd.DataFrame(buf, columns=cols)
+    finally:
+        wb.close()
+
+def validate_import_frame(df: pd.DataFrame, first_row: int = 1) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Normalisasi + validasi satu potongan import dalam satu lintasan vectorized.
+
+    Return (baris valid dengan kolom CSV_COLUMNS, laporan error per baris
+    dengan kolom IMPORT_ERROR_COLUMNS). `first_row` = nomor baris data untuk
+    baris pertama potongan ini (1 = baris data pertama file). Kolom wajib yang
+    hilang tetap ImportValidationError: seluruh file ditolak.
+    """
+    # normalisasi nama kolom → huruf kecil
+    df.columns = [str(c).strip().lower() for c in df.columns]
+
+    # mapping alias (export: keterangan/payment_method) → internal
+    for src, dst in COLUMN_ALIASES.items():
+        if src in df.columns and dst not in df.columns:
+            df[dst] = df[src]
+
+    # isi kolom opsional agar sesuai target internal
+    if "notes" not in df.columns: df["notes"] = ""
+    if "source_or_payee" not in df.columns: df["source_or_payee"] = ""
+    if "account" not in df.columns: df["account"] = ""
+
+    required = ["date", "type", "amount", "category"]
+    missing_req = [c for c in required if c not in df.columns]
+    if missing_req:
+        raise ImportValidationError(f"Kolom wajib hilang: {', '.join(missing_req)}")
+
+    # hanya ambil kolom target, index = nomor baris di file
+    raw = df[CSV_COLUMNS].set_axis(pd.RangeIndex(first_row, first_row + len(df)))
+    out = pd.DataFrame(index=raw.index)
+
+    dates = pd.to_datetime(raw["date"], errors="coerce")
+    out["date"] = dates.dt.strftime("%Y-%m-%d")
+    out["type"] = raw["type"].astype(str).str.lower().str.strip()
+    amount = pd.to_numeric(raw["amount"], errors="coerce").astype("float64")
+    amount_ok = money_ok_mask(amount)
+    out["amount"] = to_money_series(amount.where(amount_ok, 0))
+    out["category"] = raw["category"].fillna("Lainnya").astype(str).str.strip().replace("", "Lainnya")
+    for c in ("source_or_payee", "account", "notes"):
+        out[c] = raw[c].fillna("").astype(str).str.strip()
+
+    # (kolom, mask baris gagal, pesan) — dievaluasi sekaligus untuk semua baris
+    checks = [
+        ("date", dates.isna(), "Tanggal tidak valid (format YYYY-MM-DD)."),
+        ("date", out["date"] > date.today().isoformat(), "Tanggal di masa depan."),
+        ("type", ~out["type"].isin(["income", "expense"]), "Type harus 'income' atau 'expense'."),
+        ("amount", amount.isna(), "Amount bukan angka."),
+        ("amount", amount.notna() & ~amount_ok, "Amount terlalu besar / tidak valid."),
+        ("amount", amount_ok & (out["amount"] <= 0), "Amount harus lebih dari 0."),
+        ("account", (out["account"] != "") & ~out["account"].isin(VALID_PAYMENTS),
+         f"Akun harus salah satu dari: {', '.join(sorted(VALID_PAYMENTS))}."),
+    ]
+    for c, limit in TEXT_LIMITS.items():
+        checks.append((c, out[c].str.len() > limit, f"Maksimal {limit} karakter."))
+
+    bad = pd.Series(False, index=out.index)
+    reports = []
+    for col, mask, message in checks:
+        if mask.any():
+            bad |= mask
+            reports.append(pd.DataFrame({
+                "row": raw.index[mask], "field": col,
+                "value": raw.loc[mask, col].astype(str).str.slice(0, 100).to_numpy(), "message": message,
+            }))
+    errors = (pd.concat(reports, ignore_index=True).sort_values("row", kind="stable")
+              if reports else pd.DataFrame(columns=IMPORT_ERROR_COLUMNS))
+    return out[~bad].reset_index(drop=True), errors
+
+def import_categories(con, user_id: int, df: pd.DataFrame, ids: dict) -> dict:
+    """Lengkapi `ids` ({(type, nama): id}) dengan pasangan (type, category) baru di df."""
+    pairs = [k for k in set(zip(df["type"], df["category"])) if k not in ids]
+    if pairs or not ids:
+        con.executemany(
+            "INSERT OR IGNORE INTO categories(user_id,type,name) VALUES (?,?,?)",
+            [(user_id, t, n) for t, n in pairs]
+        )
+        ids.update(
+            ((r["type"], r["name"]), r["id"])
+            for r in con.execute("SELECT id, type, name FROM categories WHERE user_id=?", (user_id,))
+        )
+    return ids
+
+class ImportWriter:
+    """Tulis potongan import satu file ke transactions (dalam satu transaksi DB).
+
+    Kategori di-cache antar potongan. Baris yang fingerprint-nya sudah ada
+    sebelum import dimulai dilewati lewat anti-join per potongan, dengan
+    menghitung kemunculan: file berisi 3 baris identik sementara DB sudah
+    punya 1 -> 2 baris masuk. Jumlah kemunculan per fingerprint di file
+    disimpan di tabel TEMP, jadi memori tidak tumbuh dengan ukuran file.
+    """
+
+    def __init__(self, con, user_id: int):
+        self.con, self.user_id = con, user_id
+        self.cat_ids = {}
+        self.inserted = self.skipped = 0
+        # baris milik import ini punya id > max_id, tidak ikut dihitung "sudah ada"
+        self.max_id = con.execute("SELECT COALESCE(MAX(id), 0) FROM transactions").fetchone()[0]
+        con.execute("DROP TABLE IF EXISTS temp.import_seen")
+        con.execute("CREATE TEMP TABLE import_seen(fp INTEGER PRIMARY KEY, n INTEGER NOT NULL)")
+        con.execute("DROP TABLE IF EXISTS temp.import_chunk")
+        con.execute("CREATE TEMP TABLE import_chunk(fp INTEGER PRIMARY KEY, n INTEGER NOT NULL)")
+
+    def write(self, df: pd.DataFrame) -> int:
+        """df: kolom CSV_COLUMNS, sudah tervalidasi. Return jumlah baris yang masuk."""
+        con = self.con
+        ids = import_categories(con, self.user_id, df, self.cat_ids)
+        df = df.assign(category_id=[ids[k] for k in zip(df["type"], df["category"])])
+        df["fingerprint"] = import_fingerprints(df)
+
+        counts = df["fingerprint"].value_counts()
+        con.executemany("INSERT INTO import_chunk(fp, n) VALUES (?,?)",
+                        zip(counts.index.tolist(), counts.tolist()))
+        known = {
+            r["fp"]: (r["seen"], r["existing"])
+            for r in con.execute(
+                """
+                SELECT k.fp, COALESCE(s.n, 0) AS seen,
+                       (SELECT COUNT(*) FROM transactions t
+                        WHERE t.user_id=? AND t.fingerprint=k.fp AND t.id<=?) AS existing
+                FROM import_chunk k LEFT JOIN import_seen s ON s.fp = k.fp
+                """,
+                (self.user_id, self.max_id)
+            )
+        }
+        con.execute("""
+            INSERT INTO import_seen(fp, n) SELECT fp, n FROM import_chunk WHERE true
+            ON CONFLICT(fp) DO UPDATE SET n = n + excluded.n
+        """)
+        con.execute("DELETE FROM import_chunk")
+
+        # kemunculan ke-i (global di file) masuk hanya bila i >= jumlah yang sudah ada di DB
+        seen = df["fingerprint"].map(lambda fp: known[fp][0])
+        existing = df["fingerprint"].map(lambda fp: known[fp][1])
+        keep = (seen + df.groupby("fingerprint").cumcount()) >= existing
+        self.skipped += int((~keep).sum())
+        n = trx_insert_frame(con, self.user_id, df[keep])
+        self.inserted += n
+        return n
+
+    def close(self):
+        self.con.execute("DROP TABLE IF EXISTS temp.import_seen")
+        self.con.execute("DROP TABLE IF EXISTS temp.import_chunk")
+
 @app.get("/template.csv")
 @login_required
 def template_csv():
     sample = pd.DataFrame([
-        {"date": "2025-01-25", "type": "income",  "amount": 8500000, "category": "Gaji",  "source_or_payee": "PT Maju", "account": "BCA",  "notes": "Gaji bulanan"},
+        {"date": "2025-01-25", "type": "income",  "amount": 8500000, "category": "Gaji",  "source_or_payee": "PT Maju", "account": "Transfer", "notes": "Gaji bulanan"},
         {"date": "2025-01-27", "type": "expense", "amount":   45000, "category": "Makan", "source_or_payee": "Warung",  "account": "Tunai","notes": "Nasi Padang"},
     ], columns=CSV_COLUMNS)
     buf = io.StringIO()
@@ -1874,6 +3279,242 @@ def template_csv():
         download_name="template_transaksi.csv"
     )
 
+# ---- Job import latar belakang ----
+# /upload hanya menyimpan file ke spool dan membuat baris import_jobs; thread
+# worker membaca-validasi file per potongan ke import_staging (commit per
+# potongan), lalu memindahkan semuanya ke transactions dalam satu transaksi.
+# Job yang workernya mati (heartbeat basi) diambil alih proses mana pun saat
+# request pertamanya, atau lewat `flask finance resume-imports`. Setiap claim
+# memberi token `owner` baru; update dari worker lama (yang ternyata masih
+# hidup, mis. publish lebih lama dari IMPORT_JOB_STALE_SECONDS) ditolak
+# lewat ImportJobLost dan transaksinya di-rollback, jadi job tidak pernah
+# dipublish dua kali.
+
+IMPORT_JOB_STALE_SECONDS = 300
+# DB terkunci penulis lain (lewat busy_timeout) bukan kesalahan file: job
+# dicoba ulang dengan jeda IMPORT_BUSY_BACKOFF * 2**n detik, lalu dilepas
+# (staging tetap ada) untuk dilanjutkan resume-imports.
+IMPORT_BUSY_RETRIES = 4
+IMPORT_BUSY_BACKOFF = 1.0
+IMPORT_JOB_ACTIVE = ("queued", "staging", "publishing")
+
+_import_pool = None
+_import_pool_lock = threading.Lock()
+_import_resumed = False
+
+class ImportJobLost(Exception):
+    """Lease job sudah diambil worker lain; hentikan tanpa menyentuh job."""
+
+def _import_job_update(con, job, **fields):
+    """Update kolom job + heartbeat, hanya selama lease `job["owner"]` masih berlaku."""
+    fields["heartbeat"] = time.time()
+    cur = con.execute(
+        f"UPDATE import_jobs SET {', '.join(f'{k}=?' for k in fields)} WHERE id=? AND owner=?",
+        (*fields.values(), job["id"], job["owner"])
+    )
+    if cur.rowcount != 1:
+        raise ImportJobLost(job["id"])
+
+def claim_import_job(con, job_id: int):
+    """Ambil job aktif yang belum dipegang worker hidup; None bila sudah ada yang memegang.
+
+    Publish yang masih berjalan memegang write lock, jadi claim atas job
+    itu gagal "database is locked" setelah busy_timeout; dianggap dipegang.
+    """
+    owner = os.urandom(8).hex()
+    try:
+        with con:
+            cur = con.execute(
+                f"""
+                UPDATE import_jobs SET heartbeat=?, owner=?
+                WHERE id=? AND status IN ({",".join("?" * len(IMPORT_JOB_ACTIVE))})
+                  AND (heartbeat IS NULL OR heartbeat < ?)
+                """,
+                (time.time(), owner, job_id, *IMPORT_JOB_ACTIVE, time.time() - IMPORT_JOB_STALE_SECONDS)
+            )
+    except sqlite3.OperationalError as e:
+        if "locked" not in str(e):
+            raise
+        app.logger.info("Job import %s masih dipegang worker lain (%s).", job_id, e)
+        return None
+    if cur.rowcount != 1:
+        return None
+    return con.execute("SELECT * FROM import_jobs WHERE id=?", (job_id,)).fetchone()
+
+def _stage_import(con, job):
+    """Baca file spool per potongan ke import_staging, lanjut dari chunks_staged.
+
+    Baris tidak valid dicatat di import_errors; tanpa valid_only job gagal
+    setelah seluruh file divalidasi.
+    """
+    ext = os.path.splitext(job["filename"])[1].lower()
+    next_row = 1    # nomor baris data, dihitung juga untuk potongan yang dilewati
+    with open(job["path"], "rb") as f:
+        for n, chunk in enumerate(iter_import_chunks(f, ext)):
+            first_row, next_row = next_row, next_row + len(chunk)
+            if n < job["chunks_staged"]:
+                continue    # sudah tersimpan sebelum worker terputus
+            df, errors = validate_import_frame(chunk, first_row)
+            with con:
+                con.execute("DELETE FROM import_staging WHERE job_id=? AND chunk=?", (job["id"], n))
+                con.execute("DELETE FROM import_errors WHERE job_id=? AND chunk=?", (job["id"], n))
+                con.executemany(
+                    f"INSERT INTO import_staging(job_id, chunk, seq, {', '.join(CSV_COLUMNS)}) VALUES (?,?,?,?,?,?,?,?,?,?)",
+                    zip([job["id"]] * len(df), [n] * len(df), range(len(df)),
+                        *(df[c].tolist() for c in CSV_COLUMNS))
+                )
+                con.executemany(
+                    "INSERT OR IGNORE INTO import_errors(job_id, chunk, row, field, value, message) VALUES (?,?,?,?,?,?)",
+                    zip([job["id"]] * len(errors), [n] * len(errors),
+                        *(errors[c].tolist() for c in IMPORT_ERROR_COLUMNS))
+                )
+                _import_job_update(con, job, status="staging", chunks_staged=n + 1,
+                                   rows_staged=job["rows_staged"] + len(df),
+                                   rows_invalid=job["rows_invalid"] + errors["row"].nunique())
+            job = con.execute("SELECT * FROM import_jobs WHERE id=?", (job["id"],)).fetchone()
+    if job["rows_invalid"] and not job["valid_only"]:
+        # semua potongan sudah divalidasi: laporan lengkap sekali jalan
+        raise ImportValidationError(
+            f"{job['rows_invalid']} baris tidak valid. Unduh laporan error, perbaiki, lalu unggah ulang "
+            "(atau pilih 'Impor hanya baris valid')."
+        )
+
+def _publish_import(con, job):
+    """Staging -> transactions (semua atau tidak sama sekali), lalu bersihkan staging."""
+    with con:
+        _import_job_update(con, job, status="publishing")
+    with con:
+        con.execute("BEGIN IMMEDIATE")
+        writer = ImportWriter(con, job["user_id"])
+        for (n,) in con.execute(
+            "SELECT DISTINCT chunk FROM import_staging WHERE job_id=? ORDER BY chunk", (job["id"],)
+        ).fetchall():
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(CSV_COLUMNS)} FROM import_staging WHERE job_id=? AND chunk=? ORDER BY seq",
+                con, params=(job["id"], n)
+            )
+            writer.write(df)
+        writer.close()
+        if writer.inserted:
+            bump_data_version(con, job["user_id"])
+        con.execute("DELETE FROM import_staging WHERE job_id=?", (job["id"],))
+        _import_job_update(con, job, status="done", rows_done=writer.inserted,
+                           rows_skipped=writer.skipped,
+                           finished_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+def _db_busy(e: Exception) -> bool:
+    return isinstance(e, sqlite3.OperationalError) and ("locked" in str(e) or "busy" in str(e))
+
+def _run_import_phases(con, job):
+    """Staging (bila belum) lalu publish; error baca file -> ImportValidationError."""
+    if job["status"] != "publishing":
+        try:
+            _stage_import(con, job)
+        except (ImportValidationError, ImportJobLost):
+            raise
+        except Exception as e:
+            if _db_busy(e):
+                raise
+            raise ImportValidationError(f"Gagal membaca file: {e}") from e
+    _publish_import(con, con.execute("SELECT * FROM import_jobs WHERE id=?", (job["id"],)).fetchone())
+
+def _fail_import_job(con, job, msg: str) -> str:
+    with con:
+        _import_job_update(con, job, status="failed", error=msg,
+                           finished_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        con.execute("DELETE FROM import_staging WHERE job_id=?", (job["id"],))
+    return "failed"
+
+def _release_import_job(con, job):
+    """Lepas lease tanpa mengubah status/staging, supaya resume bisa langsung mengambilnya."""
+    try:
+        with con:
+            con.execute("UPDATE import_jobs SET heartbeat=NULL WHERE id=? AND owner=?", (job["id"], job["owner"]))
+    except sqlite3.OperationalError:
+        pass    # masih terkunci: heartbeat akan basi dengan sendirinya
+
+def run_import_job(job_id: int) -> str | None:
+    """Jalankan/lanjutkan satu job import; return status akhir (None = dipegang worker
+    lain, atau dilepas karena DB terus terkunci).
+
+    Dipanggil dari thread pool: exception apa pun dicatat ke log di sini,
+    karena Future hasil submit tidak pernah dibaca.
+    """
+    con = connect()
+    try:
+        job = claim_import_job(con, job_id)
+        if job is None:
+            return None
+        for attempt in range(IMPORT_BUSY_RETRIES + 1):
+            try:
+                _run_import_phases(con, job)
+                status = "done"
+                break
+            except ImportJobLost:
+                raise
+            except Exception as e:
+                if con.in_transaction:
+                    con.rollback()
+                if not _db_busy(e):
+                    msg = str(e) if isinstance(e, ImportValidationError) else f"Gagal menyimpan transaksi: {e}"
+                    status = _fail_import_job(con, job, msg)
+                    break
+                if attempt == IMPORT_BUSY_RETRIES:
+                    app.logger.warning("Job import %s: DB terus terkunci, dilepas untuk resume-imports.", job_id)
+                    _release_import_job(con, job)
+                    return None
+                time.sleep(IMPORT_BUSY_BACKOFF * 2 ** attempt)
+                job = con.execute("SELECT * FROM import_jobs WHERE id=?", (job_id,)).fetchone()
+        try:
+            os.remove(job["path"])
+        except OSError:
+            pass
+        return status
+    except ImportJobLost:
+        if con.in_transaction:
+            con.rollback()
+        app.logger.warning("Job import %s diambil alih worker lain; worker ini berhenti.", job_id)
+        return None
+    except Exception:
+        app.logger.exception("Job import %s gagal dijalankan", job_id)
+        return None
+    finally:
+        con.close()
+
+def submit_import_job(job_id: int):
+    """Antrekan job ke thread pool proses ini (dibuat saat pertama dipakai)."""
+    global _import_pool
+    with _import_pool_lock:
+        if _import_pool is None:
+            _import_pool = ThreadPoolExecutor(max_workers=app.config["IMPORT_WORKERS"],
+                                              thread_name_prefix="import")
+    _import_pool.submit(run_import_job, job_id)
+
+def resume_import_jobs() -> list[int]:
+    """Antrekan ulang job aktif yang workernya sudah tidak memberi heartbeat."""
+    con = connect()
+    try:
+        ids = [r[0] for r in con.execute(
+            f"""
+            SELECT id FROM import_jobs
+            WHERE status IN ({",".join("?" * len(IMPORT_JOB_ACTIVE))}) AND (heartbeat IS NULL OR heartbeat < ?)
+            ORDER BY id
+            """,
+            (*IMPORT_JOB_ACTIVE, time.time() - IMPORT_JOB_STALE_SECONDS)
+        )]
+    finally:
+        con.close()
+    for job_id in ids:
+        submit_import_job(job_id)
+    return ids
+
+@app.before_request
+def _resume_import_jobs_once():
+    global _import_resumed
+    if not _import_resumed:
+        _import_resumed = True
+        resume_import_jobs()
+
 @app.post("/upload")
 @login_required
 def upload_csv():
@@ -1883,90 +3524,170 @@ def upload_csv():
         return redirect(url_for("dashboard"))
 
     ext = os.path.splitext(f.filename)[1].lower()
-    try:
-        if ext in [".xlsx", ".xls"]:
-            df = pd.read_excel(f)
-        elif ext == ".csv":
-            df = pd.read_csv(f)
-        else:
-            flash("Format tidak didukung. Gunakan .csv atau .xlsx")
-            return redirect(url_for("dashboard"))
-    except Exception as e:
-        flash(f"Gagal membaca file: {e}")
+    if ext not in (".csv", ".xlsx", ".xls"):
+        flash("Format tidak didukung. Gunakan .csv atau .xlsx")
         return redirect(url_for("dashboard"))
 
-    # normalisasi nama kolom → huruf kecil
-    df.columns = [c.strip().lower() for c in df.columns]
+    # simpan ke spool dulu, baru buat job (file sudah lengkap saat worker mulai)
+    spool = app.config["IMPORT_SPOOL_DIR"]
+    os.makedirs(spool, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=ext, dir=spool)
+    with os.fdopen(fd, "wb") as out:
+        f.save(out)
+    with db() as con:
+        job_id = con.execute(
+            "INSERT INTO import_jobs(user_id, filename, path, valid_only, created_at) VALUES (?,?,?,?,?)",
+            (current_user.id, os.path.basename(f.filename), path, int(request.form.get("valid_only") == "1"),
+             datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        ).lastrowid
+    submit_import_job(job_id)
+    flash("File diterima, import diproses di latar belakang.", "success")
+    return redirect(url_for("import_export", job=job_id))
+
+@app.get("/api/import-jobs/<int:job_id>")
+@login_required
+def api_import_job(job_id: int):
+    """Status job import milik user: progres baris, hasil, dan pesan error."""
+    with db() as con:
+        job = con.execute(
+            """
+            SELECT id, filename, status, valid_only, chunks_staged, rows_staged, rows_done, rows_skipped,
+                   rows_invalid, error, created_at, finished_at
+            FROM import_jobs WHERE id=? AND user_id=?
+            """,
+            (job_id, current_user.id)
+        ).fetchone()
+    if not job:
+        return jsonify({"error": "job tidak ditemukan"}), 404
+    out = dict(job)
+    out["errors_url"] = url_for("import_job_errors", job_id=job_id) if job["rows_invalid"] else None
+    return jsonify(out)
 
-    # mapping alias (export: keterangan/payment_method) → internal
-    for src, dst in COLUMN_ALIASES.items():
-        if src in df.columns and dst not in df.columns:
-            df[dst] = df[src]
+@app.get("/import-jobs/<int:job_id>/errors.csv")
+@login_required
+def import_job_errors(job_id: int):
+    """Laporan baris tidak valid satu job import (CSV: data_row, field, value, message)."""
+    with db() as con:
+        job = con.execute(
+            "SELECT filename FROM import_jobs WHERE id=? AND user_id=?", (job_id, current_user.id)
+        ).fetchone()
+        if not job:
+            flash("Job import tidak ditemukan.")
+            return redirect(url_for("import_export"))
+        report = pd.read_sql_query(
+            "SELECT row AS data_row, field, value, message FROM import_errors WHERE job_id=? ORDER BY row, field",
+            con, params=(job_id,)
+        )
+    buf = io.StringIO()
+    report.to_csv(buf, index=False)
+    return send_file(
+        io.BytesIO(buf.getvalue().encode("utf-8")),
+        mimetype="text/csv",
+        as_attachment=True,
+        download_name=f"error_{os.path.splitext(job['filename'])[0]}.csv"
+    )
 
-    # isi kolom opsional agar sesuai target internal
-    if "notes" not in df.columns: df["notes"] = ""
-    if "source_or_payee" not in df.columns: df["source_or_payee"] = ""
-    if "account" not in df.columns: df["account"] = ""
+# Field publik baris riwayat di API JSON (feed dan pencarian); kolom internal
+# (user_id, cat_sort, fingerprint) tidak pernah ikut keluar.
+HISTORY_FEED_FIELDS = ("id", "date", "type", "category", "emoji", "amount", "account", "payee", "notes")
 
-    required = ["date", "type", "amount", "category"]
-    missing_req = [c for c in required if c not in df.columns]
-    if missing_req:
-        flash(f"Kolom wajib hilang: {', '.join(missing_req)}")
-        return redirect(url_for("dashboard"))
+def history_feed_values(r) -> list:
+    """Nilai baris history_rows sesuai urutan HISTORY_FEED_FIELDS."""
+    return [r["id"], r["date"], r["type"], r["category"], r["category_emoji"],
+            r["amount"], r["account"], r["source_or_payee"], r["notes"]]
+
+@app.get("/api/search")
+@login_required
+def api_search():
+    """Cari transaksi (payee/catatan/kategori) -> JSON, dengan filter & cursor
+    yang sama seperti /history."""
+    q_text = (request.args.get("q") or "").strip()[:100]
+    sort = request.args.get("sort") or "date_desc"
+    q_type = request.args.get("type") or ""
+    q_cat = request.args.get("category_id") or ""
+    if sort not in HISTORY_SORTS or q_type not in ("", "income", "expense") or (q_cat and not q_cat.isdigit()):
+        return jsonify({"error": "parameter tidak valid"}), 400
+    try:
+        per = min(max(int(request.args.get("limit", HISTORY_PER_PAGE)), 1), 100)
+    except ValueError:
+        per = HISTORY_PER_PAGE
+    if not search_match_query(q_text):
+        return jsonify({"items": [], "next": None, "prev": None})
+    with db() as con:
+        try:
+            page = history_page(con, current_user.id, sort, q_type, q_cat,
+                                request.args.get("after"), request.args.get("before"), per, q=q_text)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    items = [dict(zip(HISTORY_FEED_FIELDS, history_feed_values(r))) for r in page["rows"]]
+    return jsonify({"items": items, "next": page["next"], "prev": page["prev"]})
+
+HISTORY_FEED_MAX = 1000
+HISTORY_FEED_CHUNK = 100    # baris per potongan respons yang di-stream
 
-    # hanya ambil kolom target (yang pasti ada)
-    keep = [c for c in CSV_COLUMNS if c in df.columns]
-    df = df[keep].copy()
+@app.get("/api/transactions")
+@login_required
+def api_transactions():
+    """Feed riwayat JSON (filter, sort, dan cursor `after` sama seperti /history).
 
-    # validasi & normalisasi nilai
+    Respons di-stream langsung dari cursor SQLite:
+    {"fields": [...], "items": [[...], ...], "next": cursor atau null}.
+    """
+    sort = request.args.get("sort") or "date_desc"
+    q_type = request.args.get("type") or ""
+    q_cat = request.args.get("category_id") or ""
+    q_text = (request.args.get("q") or "").strip()[:100]
+    after = request.args.get("after") or None
+    if sort not in HISTORY_SORTS or q_type not in ("", "income", "expense") or (q_cat and not q_cat.isdigit()):
+        return jsonify({"error": "parameter tidak valid"}), 400
     try:
-        df["date"] = pd.to_datetime(df["date"]).dt.date.astype(str)
-        df["type"] = df["type"].str.lower().str.strip()
-        if not set(df["type"].dropna().unique()).issubset({"income", "expense"}):
-            raise ValueError("Kolom 'type' harus 'income' atau 'expense'.")
-
-        df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
-        if df["amount"].isna().any():
-            raise ValueError("Beberapa 'amount' tidak valid.")
-        df["category"] = df["category"].fillna("Lainnya").astype(str)
-        df["source_or_payee"] = df.get("source_or_payee", "").fillna("").astype(str)
-        df["account"] = df.get("account", "").fillna("").astype(str)
-        df["notes"] = df.get("notes", "").fillna("").astype(str)
-    except Exception as e:
-        flash(f"Validasi data gagal: {e}")
-        return redirect(url_for("dashboard"))
-    
-    # tolak baris dengan tanggal di masa depan
-    today_iso = date.today().isoformat()
-    future_mask = df["date"] > today_iso
-    if future_mask.any():
-        n = int(future_mask.sum())
-        contoh = df.loc[future_mask, "date"].iloc[0]
-        flash(f"Terdapat {n} baris dengan tanggal di masa depan (contoh: {contoh}). Perbaiki lalu unggah ulang.")
-        return redirect(url_for("dashboard"))
+        limit = min(max(int(request.args.get("limit", HISTORY_PER_PAGE)), 1), HISTORY_FEED_MAX)
+    except ValueError:
+        limit = HISTORY_PER_PAGE
+    if after:
+        try:
+            decode_cursor(after, sort)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    user_id = current_user.id
+
+    @stream_with_context
+    def generate():
+        rows = history_rows(db(), user_id, sort, q_type, q_cat, after, False, limit + 1, q_text)
+        yield '{"fields":' + json.dumps(HISTORY_FEED_FIELDS) + ',"items":['
+        chunk, sent, last, more = [], 0, None, False
+        for r in rows:
+            if sent == limit:
+                more = True     # baris ke-(limit+1) hanya penanda ada halaman berikut
+                break
+            chunk.append(json.dumps(history_feed_values(r)))
+            sent += 1
+            last = r
+            if len(chunk) == HISTORY_FEED_CHUNK:
+                yield ("," if sent > len(chunk) else "") + ",".join(chunk)
+                chunk = []
+        if chunk:
+            yield ("," if sent > len(chunk) else "") + ",".join(chunk)
+        yield '],"next":' + json.dumps(history_cursor(sort, last) if more else None) + "}"
+
+    return Response(generate(), mimetype="application/json")
+
+@app.get("/api/balances")
+@login_required
+def api_balances():
+    """Saldo per akun + net worth per tanggal (?date=YYYY-MM-DD, default hari ini)."""
+    as_of = request.args.get("date") or date.today().isoformat()
+    try:
+        as_of = date.fromisoformat(as_of).isoformat()
+    except ValueError:
+        return jsonify({"error": "date harus YYYY-MM-DD"}), 400
+    return jsonify(balance_as_of(current_user.id, as_of))
 
-    # tulis ke DB
-    with db() as con:
-        # pastikan kategori ada
-        for _, r in df.iterrows():
-            con.execute("""
-              INSERT OR IGNORE INTO categories(user_id,type,name) VALUES (?,?,?)
-            """, (current_user.id, r["type"], r["category"]))
-        con.commit()
-
-        # masukkan transaksi
-        for _, r in df.iterrows():
-            cat_id = con.execute("""
-              SELECT id FROM categories WHERE user_id=? AND type=? AND name=?
-            """, (current_user.id, r["type"], r["category"])).fetchone()["id"]
-            con.execute("""
-              INSERT INTO transactions(user_id,date,type,category_id,amount,source_or_payee,account,notes)
-              VALUES (?,?,?,?,?,?,?,?)
-            """, (current_user.id, r["date"], r["type"], cat_id,
-                  float(r["amount"]), r["source_or_payee"], r["account"], r["notes"]))
-
-    flash(f"Impor {len(df)} baris berhasil.", "success")
-    return redirect(url_for("dashboard"))
+@app.get("/api/cache-stats")
+@login_required
+def api_cache_stats():
+    """Hit/miss counter cache hasil (per proses worker)."""
+    return jsonify({c.name: c.stats() for c in (dashboard_cache, history_count_cache)})
 
 # ---- Favorites API ----
 @app.get("/api/favorites")
@@ -2012,11 +3733,14 @@ def api_favorites_create():
     amt_val = None
     if amount:
         try:
-            amt_val = float(amount)
+            amt_val = to_money(amount)
             if amt_val <= 0:
                 return jsonify({"ok": False, "msg": "Nominal favorit harus > 0."}), 400
         except:
             return jsonify({"ok": False, "msg": "Nominal favorit tidak valid."}), 400
+    err = text_limit_error(source_or_payee=source, notes=notes)
+    if err:
+        return jsonify({"ok": False, "msg": err}), 400
 
     # validasi kepemilikan kategori
     with db() as con:
@@ -2053,6 +3777,492 @@ def api_favorites_delete(fav_id):
     return jsonify({"ok": True})
 
 
+# =============================================================================
+# Tutup bulan (flask finance close-month)
+# =============================================================================
+
+# Finalisasi bulan lalu untuk semua user di luar request (cron), supaya
+# halaman tidak pernah menanggung autosave/snapshot. Per user: rollup bulan
+# itu dihitung ulang dari sumber, autosave disinkronkan, saldo akhir bulan
+# per akun disimpan ke account_checkpoints, dan realisasi budget ke
+# budget_outcomes. Semua langkah idempoten, jadi batch yang terputus aman
+# diulang. Write layer menghapus snapshot yang basi saat ada tulisan mundur;
+# balance_as_of() membangunnya lagi saat dibutuhkan.
+
+CLOSE_MONTH_BATCH = 50
+CLOSE_MONTH_WORKERS = 4
+
+def ensure_checkpoints(con, user_id: int, through: str) -> int:
+    """Lengkapi account_checkpoints s.d. bulan `through` (maks. bulan lalu).
+
+    Mulai dari snapshot terakhir yang masih ada (write layer menghapus yang
+    basi), arus per bulan sesudahnya diambil dalam satu query. Return jumlah
+    bulan yang ditulis.
+    """
+    through = min(through, (date.today().replace(day=1) - relativedelta(days=1)).strftime("%Y-%m"))
+    last = con.execute(
+        "SELECT MAX(month) FROM account_checkpoints WHERE user_id=? AND month<=?", (user_id, through)
+    ).fetchone()[0]
+    if last == through:
+        return 0
+    if last:
+        balance = {r["account"]: r["closing"] for r in con.execute(
+            "SELECT account, closing FROM account_checkpoints WHERE user_id=? AND month=?", (user_id, last)
+        )}
+        start = (date.fromisoformat(last + "-01") + relativedelta(months=1)).strftime("%Y-%m")
+    else:
+        balance = {}
+        start = con.execute(
+            """
+            SELECT MIN(m) FROM (
+                SELECT MIN(month) AS m FROM monthly_rollups WHERE user_id=?
+                UNION ALL
+                SELECT substr(MIN(date),1,7) FROM account_transfers WHERE user_id=?
+            )
+            """,
+            (user_id, user_id)
+        ).fetchone()[0] or through
+        if start > through:
+            return 0
+
+    # kunci: bulan (rollup) atau tanggal (mutasi), diringkas ke bulan di Python
+    flows = {}
+    for r in con.execute(
+        """
+        SELECT k, acc, SUM(flow) AS flow FROM (
+            SELECT month AS k, account AS acc, CASE WHEN type='income' THEN total ELSE -total END AS flow
+            FROM monthly_rollups WHERE user_id=? AND month>=? AND month<=?
+            UNION ALL
+            SELECT date, to_account, amount
+            FROM account_transfers WHERE user_id=? AND date>=? AND date<?
+            UNION ALL
+            SELECT date, from_account, -amount
+            FROM account_transfers WHERE user_id=? AND date>=? AND date<?
+        )
+        GROUP BY k, acc
+        """,
+        (user_id, start, through,
+         user_id, month_range(start)[0], month_range(through)[1],
+         user_id, month_range(start)[0], month_range(through)[1])
+    ):
+        key = (r["k"][:7], r["acc"])
+        flows[key] = flows.get(key, 0) + int(r["flow"] or 0)
+
+    rows, m = [], date.fromisoformat(start + "-01")
+    while m.strftime("%Y-%m") <= through:
+        ym = m.strftime("%Y-%m")
+        for acc in sorted(VALID_PAYMENTS):
+            opening, flow = balance.get(acc, 0), flows.get((ym, acc), 0)
+            balance[acc] = opening + flow
+            rows.append((user_id, ym, acc, opening, flow, opening + flow))
+        m += relativedelta(months=1)
+    con.executemany(
+        """
+        INSERT OR REPLACE INTO account_checkpoints(user_id, month, account, opening, flow, closing)
+        VALUES (?,?,?,?,?,?)
+        """,
+        rows
+    )
+    return len(rows) // len(VALID_PAYMENTS)
+
+def balance_as_of(user_id: int, as_of: str) -> dict:
+    """Saldo per akun dan net worth pada akhir tanggal `as_of` (YYYY-MM-DD).
+
+    = closing snapshot bulan sebelumnya (dibangun ulang di sini bila belum
+    ada/basi) + arus dari awal bulan s.d. `as_of`, jadi paling banyak satu
+    bulan baris transaksi yang dibaca.
+    """
+    month_first = as_of[:7] + "-01"
+    prev = (date.fromisoformat(month_first) - relativedelta(days=1)).strftime("%Y-%m")
+    with db() as con:
+        ensure_checkpoints(con, user_id, prev)
+        cp = con.execute(
+            "SELECT MAX(month) FROM account_checkpoints WHERE user_id=? AND month<=?", (user_id, prev)
+        ).fetchone()[0]
+        base = {acc: 0 for acc in sorted(VALID_PAYMENTS)}
+        since = ""
+        if cp:
+            for r in con.execute(
+                "SELECT account, closing FROM account_checkpoints WHERE user_id=? AND month=?", (user_id, cp)
+            ):
+                base[r["account"]] = r["closing"]
+            since = month_range(cp)[1]
+        for r in con.execute(
+            """
+            SELECT acc, SUM(flow) AS flow FROM (
+                SELECT account AS acc, CASE WHEN type='income' THEN amount ELSE -amount END AS flow
+                FROM transactions WHERE user_id=? AND date>=? AND date<=?
+                UNION ALL
+                SELECT to_account, amount FROM account_transfers WHERE user_id=? AND date>=? AND date<=?
+                UNION ALL
+                SELECT from_account, -amount FROM account_transfers WHERE user_id=? AND date>=? AND date<=?
+            )
+            WHERE acc IN ('Transfer','Tunai','E-Wallet')
+            GROUP BY acc
+            """,
+            (user_id, since, as_of) * 3
+        ):
+            base[r["acc"]] += int(r["flow"] or 0)
+    return {"date": as_of, "accounts": base, "net_worth": sum(base.values())}
+
+def close_month_for_user(con, user_id: int, month: str):
+    """Finalisasi `month` (YYYY-MM) untuk satu user. Idempoten."""
+    first, nxt = month_range(month)
+
+    # 1) rollup bulan itu dari sumber; bila ternyata drift, autosave bulan itu ikut diulang
+    old = con.execute(
+        "SELECT type, category_id, account, total, count FROM monthly_rollups WHERE user_id=? AND month=?",
+        (user_id, month)
+    ).fetchall()
+    con.execute("DELETE FROM monthly_rollups WHERE user_id=? AND month=?", (user_id, month))
+    con.execute(
+        """
+        INSERT INTO monthly_rollups(user_id, month, type, category_id, account, total, count)
+        SELECT user_id, ?, type, category_id, COALESCE(account,''), SUM(amount), COUNT(*)
+        FROM transactions
+        WHERE user_id=? AND date>=? AND date<?
+        GROUP BY type, category_id, COALESCE(account,'')
+        """,
+        (month, user_id, first, nxt)
+    )
+    new = con.execute(
+        "SELECT type, category_id, account, total, count FROM monthly_rollups WHERE user_id=? AND month=?",
+        (user_id, month)
+    ).fetchall()
+    if set(map(tuple, old)) != set(map(tuple, new)):
+        con.execute("INSERT OR IGNORE INTO savings_dirty_months(user_id, month) VALUES (?,?)", (user_id, month))
+        _invalidate_checkpoints(con, user_id, month)
+
+    # 2) autosave s.d. bulan ini
+    autosave_sync(con, user_id, month)
+
+    # 3) snapshot saldo akhir bulan (sekaligus bulan bolong sebelumnya)
+    ensure_checkpoints(con, user_id, month)
+
+    # 4) realisasi budget
+    con.execute("DELETE FROM budget_outcomes WHERE user_id=? AND month=?", (user_id, month))
+    con.execute(
+        """
+        INSERT INTO budget_outcomes(user_id, month, category_id, budget, spent)
+        SELECT b.user_id, b.month, b.category_id, b.amount,
+               COALESCE((SELECT SUM(r.total) FROM monthly_rollups r
+                         WHERE r.user_id=b.user_id AND r.month=b.month
+                           AND r.type='expense' AND r.category_id=b.category_id), 0)
+        FROM budgets b
+        WHERE b.user_id=? AND b.month=?
+        """,
+        (user_id, month)
+    )
+
+def _close_month_batch(month: str, user_ids: list[int]) -> int:
+    """Satu batch di thread worker: koneksi sendiri, satu transaksi per user."""
+    con = connect()
+    try:
+        for uid in user_ids:
+            with con:
+                close_month_for_user(con, uid, month)
+    finally:
+        con.close()
+    return len(user_ids)
+
+def close_month(month: str, workers: int = CLOSE_MONTH_WORKERS, batch: int = CLOSE_MONTH_BATCH,
+                restart: bool = False, progress=None) -> dict:
+    """Tutup `month` untuk semua user; lanjut dari progres terakhir bila pernah terputus.
+
+    User diproses urut id dalam batch paralel (maks `workers` thread).
+    month_close_runs.last_user_id hanya maju sampai batch terakhir yang
+    selesai berurutan, jadi setelah crash paling banyak beberapa batch
+    diulang (aman karena idempoten).
+    """
+    con = connect()
+    try:
+        with con:
+            if restart:
+                con.execute("DELETE FROM month_close_runs WHERE month=?", (month,))
+            con.execute(
+                "INSERT OR IGNORE INTO month_close_runs(month, started_at) VALUES (?,?)",
+                (month, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+        run = con.execute("SELECT * FROM month_close_runs WHERE month=?", (month,)).fetchone()
+        if run["finished_at"]:
+            return {"month": month, "users": 0, "already_closed": True}
+        user_ids = [r[0] for r in con.execute(
+            "SELECT id FROM users WHERE id>? ORDER BY id", (run["last_user_id"],)
+        )]
+        batches = [user_ids[i:i + batch] for i in range(0, len(user_ids), batch)]
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(_close_month_batch, month, b) for b in batches]
+            try:
+                for ids, fut in zip(batches, futures):
+                    fut.result()
+                    done += len(ids)
+                    with con:
+                        con.execute(
+                            "UPDATE month_close_runs SET last_user_id=?, users_done=users_done+? WHERE month=?",
+                            (ids[-1], len(ids), month)
+                        )
+                    if progress:
+                        progress(done, len(user_ids))
+            except BaseException:
+                for fut in futures:
+                    fut.cancel()
+                raise
+        with con:
+            con.execute(
+                "UPDATE month_close_runs SET finished_at=? WHERE month=?",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), month)
+            )
+    finally:
+        con.close()
+    return {"month": month, "users": done, "already_closed": False}
+
+
+# =============================================================================
+# CLI (flask db ..., flask finance ...)
+# =============================================================================
+
+db_cli = AppGroup("db", help="Pemeliharaan database.")
+
+@db_cli.command("upgrade")
+@click.option("--to", "target", type=int, default=None, help="Berhenti di versi ini.")
+def db_upgrade_command(target):
+    """Jalankan migrasi skema yang tertunda."""
+    applied = migrate(target)
+    if applied:
+        click.echo(f"Migrasi diterapkan: {', '.join(map(str, applied))}")
+    else:
+        click.echo("Skema sudah terbaru.")
+
+@db_cli.command("version")
+def db_version_command():
+    """Tampilkan versi skema DB vs aplikasi."""
+    with db() as con:
+        click.echo(f"DB: v{schema_version(con)}  aplikasi: v{SCHEMA_VERSION}")
+
+# Route yang query-nya atas transactions/account_transfers wajib memakai index
+PLAN_CHECK_ROUTES = (
+    "/dashboard",
+    "/accounts",
+    "/savings",
+    "/add?type=expense",
+    "/history",
+    "/history?q=warung",
+    "/api/transactions?sort=amount_desc&limit=50",
+    "/api/balances",
+)
+PLAN_CHECK_TABLES = ("transactions", "account_transfers", "t")
+# Fungsi atas kolom date membuat index (user_id, date) hanya terpakai untuk user_id
+NON_SARGABLE_DATE = re.compile(r"\b(substr|strftime|date)\s*\(\s*(\w+\.)?date\b", re.I)
+
+def _full_scans(con, statements):
+    """EXPLAIN QUERY PLAN each captured SELECT; return (sql, detail) full scans."""
+    bad, seen = [], set()
+    for sql in statements:
+        if sql in seen or not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            continue
+        seen.add(sql)
+        if NON_SARGABLE_DATE.search(sql):
+            bad.append((" ".join(sql.split()), "non-sargable filter pada kolom date"))
+        for row in con.execute("EXPLAIN QUERY PLAN " + sql).fetchall():
+            m = re.match(r"SCAN (\w+)", row["detail"])
+            if m and m.group(1) in PLAN_CHECK_TABLES:
+                bad.append((" ".join(sql.split()), row["detail"]))
+    return bad
+
+def _temp_sorts(con, statements):
+    """(sql, detail) untuk query halaman riwayat yang butuh sort tambahan."""
+    bad, seen = [], set()
+    for sql in statements:
+        # hasil FTS (jalur sparse) memang diurutkan ulang; dibatasi SEARCH_SPARSE_MATCHES
+        if sql in seen or "FROM transactions t" not in sql or "ORDER BY" not in sql or "transactions_fts" in sql:
+            continue
+        seen.add(sql)
+        for row in con.execute("EXPLAIN QUERY PLAN " + sql).fetchall():
+            if "USE TEMP B-TREE" in row["detail"]:
+                bad.append((" ".join(sql.split()), row["detail"]))
+    return bad
+
+def _history_plan_urls(client):
+    """URL riwayat: setiap HISTORY_SORTS x filter (jenis/kategori), halaman
+    pertama serta maju/mundur lewat cursor."""
+    cat = client.get("/api/categories?type=expense").get_json()[0]["id"]
+    with db() as con:
+        user_id = con.execute("SELECT id FROM users WHERE email='plan@check.local'").fetchone()["id"]
+        for sort in HISTORY_SORTS:
+            for q_type, q_cat in (("", ""), ("expense", ""), ("", str(cat)), ("expense", str(cat))):
+                args = {"sort": sort, "type": q_type or None, "category_id": q_cat or None}
+                token = history_page(con, user_id, sort, q_type, q_cat, per=1)["next"]
+                yield url_for("history", **args)
+                if token:
+                    yield url_for("history", after=token, **args)
+                    yield url_for("history", before=token, **args)
+
+def _seed_plan_check_data(client):
+    """Satu user demo dengan transaksi lintas bulan, mutasi, budget & goal."""
+    client.post("/register", data={"name": "Plan", "email": "plan@check.local", "password": "plan"})
+    client.post("/login", data={"email": "plan@check.local", "password": "plan"})
+    today = date.today()
+    last_month = (today.replace(day=1) - relativedelta(months=1)).isoformat()
+    cats = client.get("/api/categories?type=expense").get_json()
+    incs = client.get("/api/categories?type=income").get_json()
+    for d in (last_month, today.isoformat()):
+        client.post("/add", data={"date": d, "type": "income", "category_id": incs[0]["id"],
+                                  "amount": "5000000", "payment_method": "Transfer"})
+        client.post("/add", data={"date": d, "type": "expense", "category_id": cats[0]["id"],
+                                  "amount": "150000", "payment_method": "Tunai"})
+    client.post("/account-transfer", data={"from_account": "Transfer", "to_account": "E-Wallet",
+                                           "amount": "100000", "admin_fee": "1000"})
+    client.post("/budgets", data={"month": today.strftime("%Y-%m"),
+                                  "category_id": cats[0]["id"], "amount": "1000000"})
+    client.post("/savings/goals", data={"name": "Plan", "target_amount": "100000"})
+
+@db_cli.command("rebuild-rollups")
+@click.option("--user-id", type=int, default=None, help="Hanya user ini.")
+def db_rebuild_rollups_command(user_id):
+    """Hitung ulang monthly_rollups dari tabel transactions."""
+    with db() as con:
+        rebuild_rollups(con, user_id)
+        # autosave dihitung dari rollup -> semua bulan dihitung ulang di kunjungan berikutnya
+        if user_id is None:
+            con.execute("UPDATE users SET autosave_through=NULL")
+        else:
+            con.execute("UPDATE users SET autosave_through=NULL WHERE id=?", (user_id,))
+        n = con.execute("SELECT COUNT(*) FROM monthly_rollups").fetchone()[0]
+    click.echo(f"monthly_rollups dibangun ulang ({n} baris).")
+
+@db_cli.command("rebuild-search")
+@click.option("--user-id", type=int, default=None, help="Hanya user ini.")
+def db_rebuild_search_command(user_id):
+    """Isi ulang index full-text transactions_fts lalu optimize."""
+    with db() as con:
+        rebuild_search_index(con, user_id)
+        con.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('optimize')")
+        n = con.execute("SELECT COUNT(*) FROM transactions_fts").fetchone()[0]
+    click.echo(f"transactions_fts dibangun ulang ({n} baris).")
+
+@db_cli.command("verify-balances")
+@click.option("--user-id", type=int, default=None, help="Hanya user ini.")
+@click.option("--fix", is_flag=True, help="Timpa saldo tersimpan dengan hasil hitung ulang.")
+def db_verify_balances_command(user_id, fix):
+    """Bandingkan account_balances dengan hitung ulang dari sumber."""
+    with db() as con:
+        drift = verify_account_balances(con, user_id, fix=fix)
+    for d in drift:
+        click.echo(f"user {d['user_id']} {d['account']}: tersimpan {d['stored']}, seharusnya {d['expected']}")
+    if not drift:
+        click.echo("Saldo akun konsisten.")
+    elif fix:
+        click.echo(f"{len(drift)} saldo diperbaiki.")
+    else:
+        raise click.ClickException(f"{len(drift)} saldo tidak konsisten (jalankan dengan --fix).")
+
+@db_cli.command("verify-savings")
+@click.option("--user-id", type=int, default=None, help="Hanya user ini.")
+@click.option("--fix", is_flag=True, help="Timpa ringkasan tersimpan dengan hasil hitung ulang.")
+def db_verify_savings_command(user_id, fix):
+    """Bandingkan savings_ledger dan savings_goals.allocated dengan hitung ulang."""
+    with db() as con:
+        drift = verify_savings_ledger(con, user_id, fix=fix)
+    for d in drift:
+        where = f"goal {d['goal_id']}" if "goal_id" in d else d["field"]
+        click.echo(f"user {d['user_id']} {where}: tersimpan {d['stored']}, seharusnya {d['expected']}")
+    if not drift:
+        click.echo("Ringkasan tabungan konsisten.")
+    elif fix:
+        click.echo(f"{len(drift)} nilai diperbaiki.")
+    else:
+        raise click.ClickException(f"{len(drift)} nilai tidak konsisten (jalankan dengan --fix).")
+
+@db_cli.command("check-plans")
+def db_check_plans_command():
+    """Gagal bila query route utama melakukan full scan, atau halaman riwayat
+    (setiap sort x filter) butuh USE TEMP B-TREE (EXPLAIN QUERY PLAN)."""
+    saved_db = app.config["DATABASE"]
+    tmp = tempfile.mkdtemp(prefix="plans-")
+    app.config["DATABASE"] = os.path.join(tmp, "plans.db")
+    trace = []
+    try:
+        migrate()
+        app.config["SQL_TRACE"] = trace
+        client = app.test_client()
+        _seed_plan_check_data(client)
+        with app.test_request_context():
+            urls = list(PLAN_CHECK_ROUTES) + list(_history_plan_urls(client))
+        for url in urls:
+            resp = client.get(url)
+            if resp.status_code != 200:
+                raise click.ClickException(f"{url} -> HTTP {resp.status_code}")
+        app.config.pop("SQL_TRACE")
+        con = connect()
+        try:
+            bad = _full_scans(con, trace)
+            sorts = _temp_sorts(con, trace)
+        finally:
+            con.close()
+    finally:
+        app.config.pop("SQL_TRACE", None)
+        for conn in [g.pop("_db", None)] + _idle_connections():
+            if conn is not None:
+                conn.close()
+        _idle_connections().clear()
+        app.config["DATABASE"] = saved_db
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for sql, detail in bad:
+        click.echo(f"FULL SCAN: {detail}\n    {sql}")
+    for sql, detail in sorts:
+        click.echo(f"SORT: {detail}\n    {sql}")
+    if bad or sorts:
+        raise click.ClickException(f"{len(bad)} query melakukan full scan, {len(sorts)} query riwayat butuh temp B-tree.")
+    click.echo(f"OK: {len(set(trace))} statement dicek, tidak ada full scan/temp B-tree di riwayat.")
+
+finance_cli = AppGroup("finance", help="Tugas berkala (jalankan dari cron).")
+
+@finance_cli.command("close-month")
+@click.option("--month", default=None, help="YYYY-MM; default bulan lalu.")
+@click.option("--workers", type=int, default=CLOSE_MONTH_WORKERS, show_default=True, help="Thread paralel.")
+@click.option("--batch", type=int, default=CLOSE_MONTH_BATCH, show_default=True, help="User per batch.")
+@click.option("--restart", is_flag=True, help="Ulangi dari awal walau bulan ini sudah (sebagian) ditutup.")
+def finance_close_month_command(month, workers, batch, restart):
+    """Finalisasi bulan lalu: rollup, autosave, snapshot saldo akun, realisasi budget."""
+    this_month = date.today().strftime("%Y-%m")
+    month = month or (date.today().replace(day=1) - relativedelta(days=1)).strftime("%Y-%m")
+    if not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", month):
+        raise click.BadParameter("format YYYY-MM", param_hint="--month")
+    if month >= this_month:
+        raise click.BadParameter("hanya bulan yang sudah lewat yang bisa ditutup", param_hint="--month")
+    result = close_month(month, workers, batch, restart,
+                         progress=lambda n, total: click.echo(f"  {n}/{total} user"))
+    if result["already_closed"]:
+        click.echo(f"{month} sudah ditutup (pakai --restart untuk mengulang).")
+    else:
+        click.echo(f"{month} ditutup untuk {result['users']} user.")
+
+@finance_cli.command("resume-imports")
+def finance_resume_imports_command():
+    """Selesaikan job import yang terputus (worker mati) di proses ini."""
+    con = connect()
+    try:
+        ids = [r[0] for r in con.execute(
+            f"SELECT id FROM import_jobs WHERE status IN ({','.join('?' * len(IMPORT_JOB_ACTIVE))}) ORDER BY id",
+            IMPORT_JOB_ACTIVE
+        )]
+    finally:
+        con.close()
+    for job_id in ids:
+        status = run_import_job(job_id)
+        click.echo(f"job {job_id}: {status or 'masih dipegang worker lain'}")
+    if not ids:
+        click.echo("Tidak ada job import yang tertunda.")
+
+app.cli.add_command(db_cli)
+app.cli.add_command(finance_cli)
+
+# Cek versi skema sekali saat import (setelah semua helper migrasi terdefinisi)
+check_schema()
+
+
 # =============================================================================
 # Entrypoint (dev)
 # =============================================================================
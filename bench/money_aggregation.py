@@ -0,0 +1,97 @@
+"""Benchmark: SUM atas nominal REAL (skema lama) vs INTEGER rupiah (skema baru).
+
+Membuat dua tabel transaksi identik di DB sementara lalu mengukur query
+agregasi yang sama dengan yang dipakai dashboard/rollup.
+
+    python bench/money_aggregation.py --rows 300000 --repeat 7
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+DDL = """
+CREATE TABLE trx_{kind} (
+  id INTEGER PRIMARY KEY,
+  user_id INTEGER NOT NULL,
+  date TEXT NOT NULL,
+  type TEXT NOT NULL,
+  category_id INTEGER NOT NULL,
+  amount {coltype} NOT NULL
+);
+CREATE INDEX idx_trx_{kind} ON trx_{kind}(user_id, date);
+"""
+
+QUERIES = {
+    "totals": """
+        SELECT SUM(CASE WHEN type='income' THEN amount ELSE 0 END),
+               SUM(CASE WHEN type='expense' THEN amount ELSE 0 END)
+        FROM trx_{kind} WHERE user_id=?
+    """,
+    "by_month_category": """
+        SELECT substr(date,1,7), category_id, SUM(amount), COUNT(*)
+        FROM trx_{kind} WHERE user_id=?
+        GROUP BY 1, 2
+    """,
+}
+
+
+def seed(con, rows: int, users: int):
+    rnd = random.Random(42)
+    data = []
+    for i in range(rows):
+        typ = "income" if rnd.random() < 0.1 else "expense"
+        amount = rnd.randrange(1_000, 5_000_000 if typ == "income" else 500_000, 500)
+        day = f"20{rnd.randint(20, 25)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}"
+        data.append((i + 1, 1 + i % users, day, typ, rnd.randint(1, 12), amount))
+    for kind, coltype in (("real", "REAL"), ("int", "INTEGER")):
+        con.executescript(DDL.format(kind=kind, coltype=coltype))
+        con.executemany(f"INSERT INTO trx_{kind} VALUES (?,?,?,?,?,?)", data)
+    con.commit()
+
+
+def timed(con, sql, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        con.execute(sql, params).fetchall()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=300_000)
+    ap.add_argument("--users", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=7)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench-money-")
+    path = os.path.join(tmp, "money.db")
+    con = sqlite3.connect(path)
+    try:
+        seed(con, args.rows, args.users)
+        print(f"{args.rows} baris, {args.users} user, median dari {args.repeat}x (ms)")
+        print(f"{'query':<20}{'REAL':>10}{'INTEGER':>10}{'speedup':>10}")
+        for name, sql in QUERIES.items():
+            t_real = timed(con, sql.format(kind="real"), (1,), args.repeat)
+            t_int = timed(con, sql.format(kind="int"), (1,), args.repeat)
+            print(f"{name:<20}{t_real:>10.2f}{t_int:>10.2f}{t_real / t_int:>9.2f}x")
+
+        # Drift: jumlah REAL dengan nominal pecahan vs INTEGER eksak
+        con.execute("CREATE TABLE drift(amount REAL)")
+        con.executemany("INSERT INTO drift VALUES (?)", [(0.1,)] * 100_000)
+        total = con.execute("SELECT SUM(amount) FROM drift").fetchone()[0]
+        print(f"drift REAL: SUM(0.1 x 100000) = {total!r} (harusnya 10000)")
+    finally:
+        con.close()
+        for f in os.listdir(tmp):
+            os.remove(os.path.join(tmp, f))
+        os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Benchmark route lewat Flask test client: latency p50/p95 dan query per request.
+
+DB bench dibuat (lewat bench/seed.py) bila belum ada, lalu setiap route
+dipanggil --repeat kali sebagai user bench1@example.com. Jumlah query dan
+waktu DB dibaca dari header X-DB-Stats.
+
+    python bench/run.py --db /tmp/bench.db --save bench-baseline.json
+    python bench/run.py --db /tmp/bench.db --compare bench-baseline.json
+
+Route /upload juga melaporkan throughput import (baris/detik, dari p50);
+waktunya diukur sampai job import latar belakang selesai.
+Baseline JSON berisi hasil per route plus metadata (commit, jumlah baris),
+jadi dua commit bisa dibandingkan dengan --compare. Route /upload menambah
+baris ke DB bench; untuk perbandingan yang adil seed ulang DB (hapus file)
+sebelum tiap run, atau pakai --only untuk route baca saja.
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import seed as bench_seed  # noqa: E402
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile (cukup untuk sampel kecil)."""
+    s = sorted(samples)
+    return s[max(0, math.ceil(p / 100 * len(s)) - 1)]
+
+
+def parse_db_stats(header: str | None) -> dict:
+    out = {}
+    for part in (header or "").split(";"):
+        if "=" in part:
+            k, v = part.strip().split("=", 1)
+            out[k] = float(v)
+    return out
+
+
+def git_rev() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=bench_seed.ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def upload_csv(rows: int, n: int) -> bytes:
+    """CSV import sintetis; tanggal digeser per iterasi supaya tidak identik."""
+    lines = ["date,type,amount,category,source_or_payee,account,notes"]
+    for i in range(rows):
+        d = date(2020, 1 + (i + n) % 12, 1 + i % 28).isoformat()
+        cat, _, (lo, hi), payees = bench_seed.EXPENSE[i % len(bench_seed.EXPENSE)]
+        lines.append(f"{d},expense,{lo + (i * 997) % (hi - lo)},{cat},{payees[i % len(payees)]},"
+                     f"{bench_seed.ACCOUNTS[i % 3]},import {n}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def wait_import_job(client, resp) -> dict:
+    """Tunggu job import dari redirect /upload selesai; return status akhirnya."""
+    job_id = parse_qs(urlsplit(resp.headers["Location"]).query)["job"][0]
+    while True:
+        job = client.get(f"/api/import-jobs/{job_id}").get_json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.005)
+
+
+def deep_cursor(A, con, user_id: int, sort: str, offset: int) -> str:
+    """Cursor riwayat yang menunjuk ke baris ke-`offset` (halaman dalam)."""
+    keys = A.HISTORY_SORTS[sort]
+    row = con.execute(
+        f"""
+        SELECT {", ".join(e for e, _ in keys)}
+        FROM transactions t LEFT JOIN categories c ON c.id = t.category_id
+        WHERE t.user_id=?
+        ORDER BY {", ".join(f"{e} {d}" for e, d in keys)}
+        LIMIT 1 OFFSET ?
+        """,
+        (user_id, offset)
+    ).fetchone()
+    return A.encode_cursor(sort, list(row))
+
+
+def build_routes(A, con, user_id: int, upload_rows: int) -> list[tuple[str, str, object]]:
+    """(nama, path, data POST atau None) — semua route yang diukur."""
+    today = date.today()
+    year_ago = today.replace(year=today.year - 1, day=1).isoformat()
+    last_year = str(today.year - 1)
+    total = con.execute("SELECT COUNT(*) FROM transactions WHERE user_id=?", (user_id,)).fetchone()[0]
+
+    routes = [
+        ("dashboard", "/dashboard", None),
+        ("dashboard_year", f"/dashboard?start={last_year}-01-01&end={last_year}-12-31", None),
+        ("dashboard_partial", f"/dashboard?start={last_year}-02-10&end={last_year}-05-20", None),
+    ]
+    for sort in A.HISTORY_SORTS:
+        routes.append((f"history_{sort}", f"/history?sort={sort}", None))
+        routes.append((f"history_{sort}_mid", f"/history?sort={sort}&after={deep_cursor(A, con, user_id, sort, total // 2)}", None))
+        routes.append((f"history_{sort}_last", f"/history?sort={sort}&after={deep_cursor(A, con, user_id, sort, max(0, total - 21))}", None))
+    routes += [
+        ("history_expense", "/history?type=expense&sort=amount_desc", None),
+        # feed di-stream: X-DB-Stats hanya mencakup query sebelum body dikirim
+        ("api_transactions", "/api/transactions?sort=amount_desc", None),
+        ("api_transactions_1000", "/api/transactions?limit=1000", None),
+        ("accounts", "/accounts", None),
+        ("accounts_last_year", f"/accounts?month={last_year}-06", None),
+        ("savings", "/savings", None),
+        ("export_excel", f"/export/excel?start={year_ago}&end={today.isoformat()}", None),
+        ("export_pdf", f"/export/pdf?start={year_ago}&end={today.isoformat()}", None),
+        # upload terakhir: menulis data baru, jangan mengganggu route baca
+        ("upload", "/upload", upload_rows),
+    ]
+    return routes
+
+
+def run(A, repeat: int, upload_rows: int, only: str | None = None) -> dict:
+    app = A.app
+    app.config["TESTING"] = True
+    app.config["SQL_STATS_HEADER"] = True
+    # log "Request lambat" hanya mengganggu tabel hasil; angka yang sama ada di header
+    app.logger.setLevel(logging.ERROR)
+    client = app.test_client()
+    r = client.post("/login", data={"email": "bench1@example.com", "password": bench_seed.PASSWORD})
+    if r.status_code != 302:
+        raise SystemExit("Login bench1@example.com gagal — DB bukan hasil bench/seed.py?")
+
+    con = A.connect()
+    try:
+        user_id = con.execute("SELECT id FROM users WHERE email='bench1@example.com'").fetchone()[0]
+        routes = build_routes(A, con, user_id, upload_rows)
+    finally:
+        con.close()
+
+    results = {}
+    for name, path, post_rows in routes:
+        if only and only not in name:
+            continue
+        samples, queries, db_ms = [], [], []
+        for i in range(repeat + 1):
+            t0 = time.perf_counter()
+            if post_rows is None:
+                resp = client.get(path)
+            else:
+                resp = client.post(path, data={"file": (io.BytesIO(upload_csv(post_rows, i)), "bench.csv")},
+                                   content_type="multipart/form-data")
+                # import berjalan di job latar belakang: ukur sampai job selesai
+                job = wait_import_job(client, resp)
+                if job["status"] != "done":
+                    raise SystemExit(f"{name}: job import gagal: {job['error']}")
+            resp.get_data()     # respons streaming baru dieksekusi saat body dibaca
+            resp.close()
+            elapsed = (time.perf_counter() - t0) * 1000
+            if resp.status_code >= 400:
+                raise SystemExit(f"{name}: HTTP {resp.status_code} untuk {path}")
+            if i == 0:
+                continue    # pemanasan (cache halaman SQLite, template)
+            stats = parse_db_stats(resp.headers.get("X-DB-Stats"))
+            samples.append(elapsed)
+            queries.append(int(stats.get("queries", 0)))
+            db_ms.append(stats.get("db_ms", 0.0))
+        results[name] = {
+            "path": path,
+            "p50_ms": round(percentile(samples, 50), 2),
+            "p95_ms": round(percentile(samples, 95), 2),
+            "db_ms": round(statistics.median(db_ms), 2),
+            "queries": max(queries),
+        }
+        if post_rows:
+            results[name]["rows_per_s"] = round(post_rows / (results[name]["p50_ms"] / 1000))
+        print(f"{name:<34}{results[name]['p50_ms']:>10.2f}{results[name]['p95_ms']:>10.2f}"
+              f"{results[name]['db_ms']:>10.2f}{results[name]['queries']:>8}"
+              + (f"  ({results[name]['rows_per_s']} baris/detik)" if post_rows else ""))
+    return results
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> int:
+    """Cetak selisih p50/p95/query vs baseline; kembalikan jumlah regresi."""
+    base = baseline["routes"]
+    print(f"\nvs baseline {baseline['meta'].get('commit') or '?'} ({baseline['meta'].get('created')})")
+    print(f"{'route':<34}{'p50':>16}{'p95':>16}{'query':>12}")
+    regressions = 0
+    for name, cur in current.items():
+        old = base.get(name)
+        if not old:
+            print(f"{name:<34}{'(baru)':>16}")
+            continue
+        d50 = (cur["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0.0
+        d95 = (cur["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        flag = ""
+        if d50 > threshold or cur["queries"] > old["queries"]:
+            flag = "  <-- regresi"
+            regressions += 1
+        print(f"{name:<34}{d50:>+15.1f}%{d95:>+15.1f}%{old['queries']:>6}->{cur['queries']:<5}{flag}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--db", required=True, help="DB bench; di-seed otomatis bila belum ada.")
+    ap.add_argument("--users", type=int, default=5, help="(seed) jumlah user")
+    ap.add_argument("--years", type=int, default=3, help="(seed) histori tahun")
+    ap.add_argument("--per-day", type=int, default=3, help="(seed) transaksi per hari")
+    ap.add_argument("--repeat", type=int, default=15)
+    ap.add_argument("--upload-rows", type=int, default=500)
+    ap.add_argument("--only", help="Hanya route yang namanya mengandung teks ini.")
+    ap.add_argument("--no-cache", action="store_true", help="Matikan cache hasil (ukur query mentah).")
+    ap.add_argument("--save", help="Simpan hasil sebagai baseline JSON.")
+    ap.add_argument("--compare", help="Bandingkan dengan baseline JSON.")
+    ap.add_argument("--threshold", type=float, default=20.0,
+                    help="Kenaikan p50 (%%) yang dianggap regresi untuk --compare.")
+    args = ap.parse_args()
+
+    fresh = not os.path.exists(args.db)
+    A = bench_seed.load_app(args.db)
+    if fresh:
+        print("seed:", bench_seed.seed(A, args.users, args.years, args.per_day))
+    else:
+        A.migrate()     # DB bench lama: import app tidak lagi memigrasi otomatis
+
+    con = sqlite3.connect(args.db)
+    try:
+        n_users, n_trx = con.execute(
+            "SELECT (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM transactions)"
+        ).fetchone()
+    finally:
+        con.close()
+    if args.no_cache:
+        for cache in (A.dashboard_cache, A.history_count_cache):
+            cache.maxsize = 0
+    print(f"{n_users} user, {n_trx} transaksi, {args.repeat}x per route (ms)")
+    print(f"{'route':<34}{'p50':>10}{'p95':>10}{'db':>10}{'query':>8}")
+    results = run(A, args.repeat, args.upload_rows, args.only)
+
+    report = {
+        "meta": {
+            "commit": git_rev(),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "users": n_users,
+            "transactions": n_trx,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+        },
+        "routes": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nbaseline disimpan: {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
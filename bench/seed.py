@@ -0,0 +1,205 @@
+"""Generator data sintetis: N user dengan histori bertahun-tahun.
+
+Skema dibuat lewat migrasi aplikasi (schema.sql + MIGRATIONS), lalu data
+ditulis lewat write layer (trx_insert_many / transfer_insert / savings_*)
+supaya tabel turunan (rollup, saldo akun, ringkasan tabungan) ikut terisi
+persis seperti di produksi.
+
+    python bench/seed.py --db /tmp/bench.db --users 5 --years 3 --per-day 3
+
+Semua user memakai password yang sama (PASSWORD) dan email bench{N}@example.com.
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = "bench"
+
+INCOME = {
+    "Gaji": ["PT Sinar Jaya", "PT Maju Bersama"],
+    "Bonus": ["PT Sinar Jaya"],
+    "Freelance": ["Klien Upwork", "Studio Desain", "Toko Online"],
+    "Investasi": ["Reksa Dana", "Deposito", "Dividen"],
+}
+
+# (kategori, bobot, (min, max) nominal, payee)
+EXPENSE = [
+    ("Makan", 40, (15_000, 120_000), ["Warung Padang", "Warteg Bahari", "GoFood", "Bakso Pak Kumis", "Sate Madura"]),
+    ("Kopi", 12, (18_000, 65_000), ["Kopi Kenangan", "Janji Jiwa", "Starbucks", "Fore Coffee"]),
+    ("Transport", 18, (10_000, 150_000), ["Gojek", "Grab", "KRL", "Pertamina", "TransJakarta"]),
+    ("Belanja", 12, (25_000, 750_000), ["Indomaret", "Alfamart", "Tokopedia", "Shopee", "Superindo"]),
+    ("Hiburan", 5, (30_000, 400_000), ["Netflix", "CGV", "Spotify", "Steam"]),
+    ("Kesehatan", 3, (20_000, 600_000), ["Apotek K24", "Klinik Pratama", "Halodoc"]),
+    ("Tagihan", 4, (50_000, 1_500_000), ["PLN", "Indihome", "PDAM", "Telkomsel"]),
+    ("Pendidikan", 2, (100_000, 2_000_000), ["Udemy", "Gramedia", "Kursus Bahasa"]),
+    ("Lainnya", 4, (5_000, 300_000), ["Parkir", "Laundry", "Fotokopi", "Donasi"]),
+]
+
+ACCOUNTS = ["Transfer", "E-Wallet", "Tunai"]
+ACCOUNT_WEIGHTS = [30, 40, 30]
+NOTES = ["", "", "", "", "kantor", "bareng teman", "promo", "cicilan", "keluarga", "darurat"]
+
+
+def _amount(rnd, lo, hi):
+    return rnd.randrange(lo, hi, 500)
+
+
+def _months(start: date, end: date):
+    y, m = start.year, start.month
+    while (y, m) <= (end.year, end.month):
+        yield y, m
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+
+
+def seed_user(A, con, rnd, uid: int, years: int, per_day: int, today: date):
+    """Isi semua data milik satu user (kategori s.d. tabungan)."""
+    # Kategori default + tambahan yang dipakai generator
+    cat = {}
+    names = [("income", n) for n in INCOME] + [("expense", e[0]) for e in EXPENSE] + [("expense", "Tabungan")]
+    con.executemany(
+        "INSERT OR IGNORE INTO categories(user_id,type,name,emoji) VALUES (?,?,?,?)",
+        [(uid, t, n, A.DEFAULT_EMOJI.get((t, n))) for t, n in names]
+    )
+    for r in con.execute("SELECT id, type, name FROM categories WHERE user_id=?", (uid,)):
+        cat[(r["type"], r["name"])] = r["id"]
+
+    start = date(today.year - years, today.month, 1)
+    exp_names = [e[0] for e in EXPENSE]
+    exp_weights = [e[1] for e in EXPENSE]
+    exp_by_name = {e[0]: e for e in EXPENSE}
+    # gaji diskalakan dengan volume belanja supaya saldo bulanan umumnya positif
+    salary = per_day * 30 * 110_000
+
+    rows = []
+    d = start
+    while d <= today:
+        iso = d.isoformat()
+        if d.day == 25:
+            rows.append({"date": iso, "type": "income", "category_id": cat[("income", "Gaji")],
+                         "amount": salary + _amount(rnd, 0, 500_000), "source_or_payee": rnd.choice(INCOME["Gaji"]),
+                         "account": "Transfer", "notes": None})
+        if d.day == 10 and rnd.random() < 0.35:
+            name = rnd.choice(["Freelance", "Investasi", "Bonus"])
+            rows.append({"date": iso, "type": "income", "category_id": cat[("income", name)],
+                         "amount": _amount(rnd, 250_000, salary // 2), "source_or_payee": rnd.choice(INCOME[name]),
+                         "account": "Transfer", "notes": None})
+        for _ in range(rnd.randint(0, 2 * per_day)):
+            name = rnd.choices(exp_names, exp_weights)[0]
+            _, _, (lo, hi), payees = exp_by_name[name]
+            rows.append({"date": iso, "type": "expense", "category_id": cat[("expense", name)],
+                         "amount": _amount(rnd, lo, hi), "source_or_payee": rnd.choice(payees),
+                         "account": rnd.choices(ACCOUNTS, ACCOUNT_WEIGHTS)[0],
+                         "notes": rnd.choice(NOTES) or None})
+        d += timedelta(days=1)
+    A.trx_insert_many(con, uid, rows)
+
+    # Mutasi antar akun (tarik tunai / top-up e-wallet) beberapa kali per bulan
+    transfers = 0
+    for y, m in _months(start, today):
+        for _ in range(rnd.randint(1, 4)):
+            day = min(rnd.randint(1, 28), today.day) if (y, m) == (today.year, today.month) else rnd.randint(1, 28)
+            src, dst = rnd.sample(ACCOUNTS, 2)
+            A.transfer_insert(con, uid, date(y, m, day).isoformat(), src, dst,
+                              _amount(rnd, 50_000, 1_000_000), rnd.choice(["Tarik tunai", "Top-up", None]))
+            transfers += 1
+
+    # Budget bulanan untuk beberapa kategori pengeluaran
+    budget_rows = []
+    for y, m in _months(start, today):
+        for name in rnd.sample(exp_names, 4):
+            lo, hi = exp_by_name[name][2]
+            budget_rows.append((uid, cat[("expense", name)], f"{y:04d}-{m:02d}", _amount(rnd, hi * 3, hi * 12)))
+    con.executemany("INSERT INTO budgets(user_id,category_id,month,amount) VALUES (?,?,?,?)", budget_rows)
+
+    # Favorit (template transaksi)
+    favs = []
+    for i, name in enumerate(rnd.sample(exp_names, 5)):
+        lo, hi = exp_by_name[name][2]
+        favs.append((uid, f"{name} rutin {i + 1}", "expense", cat[("expense", name)], _amount(rnd, lo, hi),
+                     rnd.choice(ACCOUNTS), rnd.choice(exp_by_name[name][3]), None))
+    con.executemany(
+        """
+        INSERT INTO favorites(user_id,name,type,category_id,amount,account,source_or_payee,notes)
+        VALUES (?,?,?,?,?,?,?,?)
+        """,
+        favs
+    )
+
+    # Goal tabungan + alokasi kecil per kuartal (jauh di bawah sisa bulanan)
+    goals = 0
+    for name, target in (("Dana Darurat", salary * 6), ("Liburan", salary * 2), ("Laptop Baru", salary), ("HP", salary // 2)):
+        gid = con.execute(
+            "INSERT INTO savings_goals(user_id,name,target_amount,created_at) VALUES (?,?,?,?)",
+            (uid, name, target, f"{start.isoformat()} 08:00:00")
+        ).lastrowid
+        goals += 1
+        for y, m in _months(start, today):
+            if m % 3 == 0 and (y, m) != (today.year, today.month):
+                A.savings_allocation_insert(con, uid, gid, _amount(rnd, 50_000, max(100_000, target // (years * 8))),
+                                            date(y, m, 28).isoformat())
+
+    # Top-up manual bulan berjalan (ikut dicatat sebagai transaksi Tabungan)
+    topup = 100_000
+    tx_id = A.trx_insert(con, uid, today.isoformat(), "expense", cat[("expense", "Tabungan")], topup,
+                         "Top-up Tabungan", "Transfer", None)
+    A.savings_topup_add(con, uid, today.strftime("%Y-%m"), today.isoformat(), topup, None, tx_id)
+    return {"transactions": len(rows) + 1, "transfers": transfers, "budgets": len(budget_rows),
+            "favorites": len(favs), "goals": goals}
+
+
+def seed(A, users: int, years: int, per_day: int, rnd_seed: int = 42) -> dict:
+    """Buat `users` user baru di DB aktif aplikasi; kembalikan ringkasan jumlah baris."""
+    from werkzeug.security import generate_password_hash
+
+    A.migrate()
+    rnd = random.Random(rnd_seed)
+    today = date.today()
+    pw_hash = generate_password_hash(PASSWORD)    # hash sekali, dipakai semua user
+    summary = {"users": 0}
+    con = A.connect()
+    try:
+        offset = con.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        for i in range(users):
+            with con:
+                uid = con.execute(
+                    "INSERT INTO users(name,email,password_hash) VALUES (?,?,?)",
+                    (f"Bench {offset + i + 1}", f"bench{offset + i + 1}@example.com", pw_hash)
+                ).lastrowid
+                counts = seed_user(A, con, rnd, uid, years, per_day, today)
+            summary["users"] += 1
+            for k, v in counts.items():
+                summary[k] = summary.get(k, 0) + v
+    finally:
+        con.close()
+    return summary
+
+
+def load_app(db_path: str):
+    """Import app.py dengan FINANCE_DB_PATH menunjuk ke DB bench (bukan finance.db)."""
+    os.environ["FINANCE_DB_PATH"] = os.path.abspath(db_path)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import app as A
+    return A
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--db", required=True, help="Path DB tujuan (dibuat bila belum ada).")
+    ap.add_argument("--users", type=int, default=5)
+    ap.add_argument("--years", type=int, default=3)
+    ap.add_argument("--per-day", type=int, default=3, help="Rata-rata transaksi pengeluaran per hari.")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    A = load_app(args.db)
+    summary = seed(A, args.users, args.years, args.per_day, args.seed)
+    print(", ".join(f"{k}={v}" for k, v in summary.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+-- Baseline schema (migrasi #1). Perubahan skema berikutnya ditambahkan sebagai
+-- migrasi bernomor di MIGRATIONS (app.py), lalu jalankan `flask db upgrade`.
+
 -- Users
 CREATE TABLE IF NOT EXISTS users (
   id INTEGER PRIMARY KEY AUTOINCREMENT,